@@ -0,0 +1,37 @@
+"""
+Настройки gunicorn для запуска API в production: gunicorn -c config/gunicorn.conf.py config.wsgi.
+Все параметры задаются переменными окружения GUNICORN_*.
+"""
+
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND") or "0.0.0.0:88"
+workers = int(os.getenv("GUNICORN_WORKERS") or multiprocessing.cpu_count() * 2 + 1)
+# Каждый поток держит свое соединение с базой: всего до workers * threads соединений.
+threads = int(os.getenv("GUNICORN_THREADS") or 1)
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = (os.getenv("GUNICORN_PRELOAD") or "True") == "True"
+timeout = int(os.getenv("GUNICORN_TIMEOUT") or 30)
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT") or 30)
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE") or 5)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS") or 1000)
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER") or 100)
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL") or "info"
+
+
+def pre_fork(server, worker):
+    """
+    Соединения с базой, открытые мастер-процессом при загрузке приложения, закрываются в мастере
+    до запуска воркера: закрытие в воркере завершило бы сокет, общий с мастером и другими воркерами.
+    Каждый воркер открывает свои соединения.
+    """
+    from django.db import connections
+
+    connections.close_all()
@@ -0,0 +1,87 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление выполнило больше SQL-запросов, чем указано в его query_budget."""
+
+
+class QueryStats:
+    """Обертка выполнения SQL-запросов: считает количество запросов и суммарное время в базе."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def get_query_budget(request):
+    """
+    Бюджет запросов представления: атрибут query_budget класса представления.
+    Число задает бюджет для всех запросов к представлению, словарь - по действию viewset
+    (list, retrieve, ...) или по HTTP-методу (get, post, ...).
+    """
+    match = request.resolver_match
+    view_class = getattr(getattr(match, "func", None), "cls", None)
+    budget = getattr(view_class, "query_budget", None)
+    if not isinstance(budget, dict):
+        return budget
+
+    method = request.method.lower()
+    actions = getattr(match.func, "actions", None) or {}
+    return budget.get(actions.get(method, method))
+
+
+class QueryStatsMiddleware:
+    """
+    Количество SQL-запросов, время в базе и общее время обработки запроса по имени представления.
+    Значения пишутся в лог, в режиме DEBUG добавляются в заголовки ответа. Превышение бюджета
+    запросов представления пишется в лог как предупреждение, при QUERY_BUDGET_ENFORCED вызывает
+    исключение QueryBudgetExceeded (используется в тестах).
+    Запросы, выполняемые при передаче потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view_name = getattr(request.resolver_match, "view_name", None) or request.path
+        logger.debug(
+            "%s %s: %s запросов, база %.1f мс, всего %.1f мс",
+            request.method,
+            view_name,
+            stats.count,
+            stats.duration * 1000,
+            duration * 1000,
+        )
+
+        budget = get_query_budget(request)
+        if budget is not None and stats.count > budget:
+            message = f"{request.method} {view_name}: {stats.count} SQL-запросов при бюджете {budget}"
+            if settings.QUERY_BUDGET_ENFORCED:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = stats.count
+            response["X-DB-Time"] = f"{stats.duration * 1000:.1f}"
+            response["X-Response-Time"] = f"{duration * 1000:.1f}"
+        return response
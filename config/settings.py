@@ -3,6 +3,7 @@ import sys
 from datetime import timedelta
 from pathlib import Path
 
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.middleware.QueryStatsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,10 +62,14 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "config.wsgi.application"
 
+JWT_STATELESS_AUTH = True if os.getenv("JWT_STATELESS_AUTH") == "True" else False
+
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.StatelessJWTAuthentication"
+        if JWT_STATELESS_AUTH
+        else "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -78,6 +84,8 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT", default="5432"),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE") or 0),
+        "CONN_HEALTH_CHECKS": (os.getenv("DB_CONN_HEALTH_CHECKS") or "True") == "True",
     }
 }
 
@@ -117,9 +125,34 @@ AUTH_USER_MODEL = "users.User"
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.UserTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.UserTokenRefreshSerializer",
 }
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_CLIENT = os.getenv("STRIPE_CLIENT") or "users.services.StripeClient"
+STRIPE_STUB_SESSION = {"status": "complete", "payment_status": "paid"}
+STRIPE_RATE_LIMIT = int(os.getenv("STRIPE_RATE_LIMIT") or 20)
+
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.getenv("PAYMENT_RECONCILE_BATCH_SIZE", 200))
+PAYMENT_RECONCILE_WORKERS = int(os.getenv("PAYMENT_RECONCILE_WORKERS", 8))
+PAYMENT_RECONCILE_STALE_AFTER = timedelta(
+    minutes=int(os.getenv("PAYMENT_RECONCILE_STALE_AFTER_MINUTES", 15))
+)
+
+PROFILE_PAYMENTS_LIMIT = int(os.getenv("PROFILE_PAYMENTS_LIMIT") or 5)
+PAYMENT_EXPORT_CHUNK_SIZE = int(os.getenv("PAYMENT_EXPORT_CHUNK_SIZE") or 2000)
+
+PAYMENT_CHECKOUT_MAX_RETRIES = int(os.getenv("PAYMENT_CHECKOUT_MAX_RETRIES", 5))
+PAYMENT_CHECKOUT_RETRY_BACKOFF = int(os.getenv("PAYMENT_CHECKOUT_RETRY_BACKOFF", 5))
+PAYMENT_CHECKOUT_RETRY_BACKOFF_MAX = int(os.getenv("PAYMENT_CHECKOUT_RETRY_BACKOFF_MAX", 5 * 60))
+
+EXCHANGE_RATE_SOURCE = os.getenv("EXCHANGE_RATE_SOURCE") or "users.services.ForexRateSource"
+EXCHANGE_RATE_PAIRS = [("RUB", "USD")]
+EXCHANGE_RATES = {"RUB": {"USD": float(os.getenv("EXCHANGE_RATE_RUB_USD") or 0.011)}}
+EXCHANGE_RATE_TTL = int(os.getenv("EXCHANGE_RATE_TTL", 2 * 60 * 60))
+EXCHANGE_RATE_LOCAL_TTL = int(os.getenv("EXCHANGE_RATE_LOCAL_TTL", 60))
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
@@ -133,10 +166,32 @@ CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CELERY_BEAT_SCHEDULE = {
     "deactivate_inactive_users": {
         "task": "users.tasks.deactivate_inactive_users",
-        "schedule": timedelta(weeks=4),
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "dispatch_course_notifications": {
+        "task": "materials.tasks.dispatch_course_notifications",
+        "schedule": timedelta(minutes=1),
+    },
+    "refresh_exchange_rates": {
+        "task": "users.tasks.refresh_exchange_rates",
+        "schedule": timedelta(minutes=30),
+    },
+    "reconcile_unpaid_payments": {
+        "task": "users.tasks.reconcile_unpaid_payments",
+        "schedule": timedelta(minutes=15),
     },
 }
 
+USER_INACTIVITY_PERIOD = timedelta(days=30)
+DEACTIVATE_USERS_BATCH_SIZE = int(os.getenv("DEACTIVATE_USERS_BATCH_SIZE", 1000))
+
+COURSE_NOTIFICATION_DELAY = timedelta(
+    minutes=int(os.getenv("COURSE_NOTIFICATION_DELAY_MINUTES") or 4 * 60)
+)
+COURSE_NOTIFICATION_BATCH_SIZE = int(os.getenv("COURSE_NOTIFICATION_BATCH_SIZE", 500))
+
+LESSON_BULK_MAX_SIZE = int(os.getenv("LESSON_BULK_MAX_SIZE", 500))
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.getenv("EMAIL_HOST")
 EMAIL_PORT = os.getenv("EMAIL_PORT")
@@ -149,7 +204,17 @@ SERVER_EMAIL = os.getenv("SERVER_EMAIL")
 
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
 
+EMAIL_CHUNK_SIZE = int(os.getenv("EMAIL_CHUNK_SIZE") or 100)
+EMAIL_CHUNK_MAX_RETRIES = int(os.getenv("EMAIL_CHUNK_MAX_RETRIES") or 5)
+EMAIL_RETRY_BACKOFF = int(os.getenv("EMAIL_RETRY_BACKOFF", 60))
+EMAIL_RETRY_BACKOFF_MAX = int(os.getenv("EMAIL_RETRY_BACKOFF_MAX", 60 * 60))
+EMAIL_REPORT_TIMEOUT = int(os.getenv("EMAIL_REPORT_TIMEOUT") or 24 * 60 * 60)
+
+QUERY_BUDGET_ENFORCED = os.getenv("QUERY_BUDGET_ENFORCED") == "True"
+
 CACHE_ENABLED = True
+CACHE_TIMEOUT = int(os.getenv("CACHE_TIMEOUT") or 5 * 60)
+ROLE_CACHE_TIMEOUT = int(os.getenv("ROLE_CACHE_TIMEOUT", 10 * 60))
 if CACHE_ENABLED:
     CACHES = {
         "default": {
@@ -159,5 +224,12 @@ if CACHE_ENABLED:
     }
 
 if 'test' in sys.argv:
+    QUERY_BUDGET_ENFORCED = True
     CELERY_TASK_ALWAYS_EAGER = True
     CELERY_TASK_EAGER_PROPAGATES = True
+    EXCHANGE_RATE_SOURCE = "users.services.FixedRateSource"
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
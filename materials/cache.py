@@ -0,0 +1,201 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+HITS_KEY = "materials:cache:hits"
+MISSES_KEY = "materials:cache:misses"
+VALIDATOR_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
+
+def courses_scope():
+    return "courses"
+
+
+def course_scope(course_id):
+    return f"course:{course_id}"
+
+
+def lessons_scope():
+    return "lessons"
+
+
+def lesson_scope(lesson_id):
+    return f"lesson:{lesson_id}"
+
+
+def subscriptions_scope(user_id):
+    return f"user:{user_id}:subscriptions"
+
+
+def _version_key(scope):
+    return f"materials:version:{scope}"
+
+
+def get_versions(scopes):
+    """Текущие версии областей кеша. Отсутствующая версия считается нулевой."""
+    keys = [_version_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    return [values.get(key, 0) for key in keys]
+
+
+def invalidate(*scopes):
+    """
+    Сброс закешированных ответов для указанных областей.
+    Записи не удаляются, а меняется версия области, входящая в ключ кеша.
+    """
+    if not settings.CACHE_ENABLED or not scopes:
+        return
+    version = time.time_ns()
+    cache.set_many({_version_key(scope): version for scope in scopes}, timeout=None)
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def get_cache_stats():
+    """Счетчики попаданий и промахов кеша ответов."""
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
+
+
+class CachedResponseMixin:
+    """
+    Кеширование сериализованных ответов list/retrieve.
+    Ключ включает полный URL запроса, версии областей из get_cache_scopes() и, при cache_per_user,
+    id пользователя (для полей, зависящих от пользователя, например is_subscribed).
+    Вместе с данными сохраняются заголовки-валидаторы, поэтому условный запрос при попадании в кеш
+    получает 304 без обращения к базе.
+    """
+
+    cache_per_user = False
+    permission_fields = ("id", "owner")
+
+    def get_cache_scopes(self):
+        return []
+
+    def get_cache_key(self):
+        request = self.request
+        parts = [request.build_absolute_uri()]
+        if self.cache_per_user:
+            parts.append(f"user={request.user.pk}")
+        parts.extend(str(version) for version in get_versions(self.get_cache_scopes()))
+        digest = hashlib.md5("|".join(parts).encode()).hexdigest()
+        return f"materials:response:{digest}"
+
+    def get_permission_queryset(self):
+        return self.queryset.model._default_manager.only(*self.permission_fields)
+
+    def get_permission_object(self):
+        """
+        Объект для проверки прав без полной загрузки: только поля, нужные разрешениям.
+        Результат запоминается на время запроса.
+        """
+        if not hasattr(self, "_permission_object"):
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            obj = get_object_or_404(
+                self.get_permission_queryset(),
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+            )
+            self.check_object_permissions(self.request, obj)
+            self._permission_object = obj
+        return self._permission_object
+
+    def check_cached_permissions(self):
+        """
+        Проверка прав при ответе из кеша: для детального просмотра загружаются только поля,
+        нужные разрешениям, вместо полного объекта.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            self.get_permission_object()
+
+    def cached_response(self, handler, *args, **kwargs):
+        if not settings.CACHE_ENABLED:
+            return handler(*args, **kwargs)
+
+        key = self.get_cache_key()
+        entry = cache.get(key)
+        if entry is not None:
+            self.check_cached_permissions()
+            _increment(HITS_KEY)
+            headers = entry["headers"]
+            last_modified = parse_http_date_safe(headers.get("Last-Modified"))
+            not_modified = get_conditional_response(
+                self.request, etag=headers.get("ETag"), last_modified=last_modified
+            )
+            response = Response(entry["data"]) if not_modified is None else not_modified
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+        _increment(MISSES_KEY)
+        response = handler(*args, **kwargs)
+        if response.status_code == 200:
+            headers = {
+                name: response[name]
+                for name in VALIDATOR_HEADERS
+                if response.has_header(name)
+            }
+            cache.set(
+                key,
+                {"data": response.data, "headers": headers},
+                timeout=settings.CACHE_TIMEOUT,
+            )
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для list/retrieve: ETag и Last-Modified строятся по состоянию из
+    get_validator_state() (дата последнего изменения и значения, от которых зависит ответ).
+    Last-Modified отдается, только если дата изменения описывает весь ответ, иначе клиент,
+    приславший лишь If-Modified-Since, получил бы 304 на устаревшие данные.
+    При совпадении валидаторов клиента ответ 304 отдается без сериализации.
+    """
+
+    def get_validator_state(self):
+        """
+        Пара (дата последнего изменения, список значений состояния ответа).
+        Если ответ зависит не только от даты, вместо нее возвращается None, а дата входит в состояние.
+        """
+        raise NotImplementedError
+
+    def get_etag(self, last_modified, state):
+        request = self.request
+        parts = [request.get_full_path(), f"user={request.user.pk}", str(last_modified)]
+        parts.extend(str(value) for value in state)
+        return quote_etag(hashlib.md5("|".join(parts).encode()).hexdigest())
+
+    def conditional_response(self, handler, *args, **kwargs):
+        last_modified, state = self.get_validator_state()
+        etag = self.get_etag(last_modified, state)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(*args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(timestamp)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
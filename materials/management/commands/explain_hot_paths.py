@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from materials.models import Course, Lesson, Subscription
+from users.models import Pay, User
+
+HOT_PATH_INDEXES = [
+    (Subscription, ["user_id", "course_id"]),
+    (Lesson, ["course_id", "id"]),
+    (Course, ["update_at", "id"]),
+    (Pay, ["user_id", "payment_date"]),
+    (Pay, ["session_id"]),
+    (User, ["is_active", "last_login"]),
+]
+
+
+def hot_path_queries():
+    """Запросы горячих путей с параметрами из существующих данных."""
+    user_id = User.objects.values_list("id", flat=True).first() or 0
+    course_id = Course.objects.values_list("id", flat=True).first() or 0
+    session_id = (
+        Pay.objects.exclude(session_id=None).values_list("session_id", flat=True).first()
+        or ""
+    )
+    inactive_since = timezone.now() - settings.USER_INACTIVITY_PERIOD
+    return {
+        "Подписка пользователя на курс": Subscription.objects.filter(
+            user_id=user_id, course_id=course_id
+        )[:1],
+        "Уроки курса": Lesson.objects.filter(course_id=course_id).order_by("id")[:10],
+        "Курсы по дате обновления": Course.objects.order_by("update_at", "id")[:5],
+        "Платежи пользователя": Pay.objects.filter(user_id=user_id).order_by(
+            "-payment_date"
+        )[:10],
+        "Платеж по id сессии": Pay.objects.filter(session_id=session_id),
+        "Неактивные пользователи": User.objects.filter(
+            is_active=True, last_login__lt=inactive_since
+        ).values("pk")[: settings.DEACTIVATE_USERS_BATCH_SIZE],
+    }
+
+
+def drop_hot_path_indexes(cursor):
+    """Удаление индексов горячих путей; вызывается только внутри откатываемой транзакции."""
+    quote = connection.ops.quote_name
+    for model, columns in HOT_PATH_INDEXES:
+        table = model._meta.db_table
+        constraints = connection.introspection.get_constraints(cursor, table)
+        for name, details in constraints.items():
+            if details["columns"] != columns or details["primary_key"]:
+                continue
+            if details["index"]:
+                cursor.execute(f"DROP INDEX {quote(name)}")
+            elif details["unique"]:
+                cursor.execute(f"ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Планы выполнения запросов горячих путей. С --compare дополнительно выводятся планы без индексов "
+        "горячих путей: индексы удаляются в транзакции, которая затем откатывается (на время сравнения "
+        "таблицы блокируются, запускать не на рабочей базе)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Сравнить с планами без индексов горячих путей",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Выполнить запросы (EXPLAIN ANALYZE) и вывести фактическое время",
+        )
+
+    def explain(self, title, analyze):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in hot_path_queries().items():
+            self.stdout.write(self.style.MIGRATE_LABEL(name))
+            self.stdout.write(queryset.explain(analyze=analyze))
+            self.stdout.write("")
+
+    def handle(self, *args, **options):
+        self.explain("С индексами", options["analyze"])
+        if not options["compare"]:
+            return
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                drop_hot_path_indexes(cursor)
+            self.explain("Без индексов", options["analyze"])
+            transaction.set_rollback(True)
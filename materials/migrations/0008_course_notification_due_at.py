@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0007_alter_course_notification_task_id"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="course",
+            options={
+                "ordering": ["id"],
+                "verbose_name": "Курс",
+                "verbose_name_plural": "Курсы",
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="lesson",
+            options={
+                "ordering": ["id"],
+                "verbose_name": "Урок",
+                "verbose_name_plural": "Уроки",
+            },
+        ),
+        migrations.RemoveField(
+            model_name="course",
+            name="notification_task_id",
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="notification_due_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                null=True,
+                verbose_name="Время отправки уведомления",
+            ),
+        ),
+    ]
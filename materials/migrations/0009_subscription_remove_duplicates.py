@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:10
+
+from django.db import migrations
+from django.db.models import Min
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    """Удаление повторных подписок пользователя на курс, сохраняется самая ранняя."""
+    Subscription = apps.get_model("materials", "Subscription")
+    first_ids = (
+        Subscription.objects.order_by()
+        .values("user_id", "course_id")
+        .annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    Subscription.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0008_course_notification_due_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_subscriptions, migrations.RunPython.noop),
+    ]
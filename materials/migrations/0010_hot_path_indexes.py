@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("materials", "0009_subscription_remove_duplicates"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="course",
+            index=models.Index(
+                fields=["update_at", "id"], name="materials_course_update_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="lesson",
+            index=models.Index(
+                fields=["course", "id"], name="materials_lesson_course_idx"
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql="DROP INDEX CONCURRENTLY IF EXISTS materials_subscription_user_course_uniq",
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    sql="CREATE UNIQUE INDEX CONCURRENTLY materials_subscription_user_course_uniq "
+                    "ON materials_subscription (user_id, course_id)",
+                    reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS materials_subscription_user_course_uniq",
+                ),
+                migrations.RunSQL(
+                    sql="ALTER TABLE materials_subscription ADD CONSTRAINT materials_subscription_user_course_uniq "
+                    "UNIQUE USING INDEX materials_subscription_user_course_uniq",
+                    reverse_sql="ALTER TABLE materials_subscription "
+                    "DROP CONSTRAINT IF EXISTS materials_subscription_user_course_uniq",
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="subscription",
+                    constraint=models.UniqueConstraint(
+                        fields=("user", "course"),
+                        name="materials_subscription_user_course_uniq",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -28,8 +28,11 @@ class Course(models.Model):
     update_at = models.DateTimeField(
         auto_now=True, verbose_name="Дата обновления курса"
     )
-    notification_task_id = models.CharField(
-        max_length=255, null=True, blank=True, verbose_name="id задачи уведомления"
+    notification_due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        verbose_name="Время отправки уведомления",
     )
 
     def __str__(self):
@@ -39,6 +42,9 @@ class Course(models.Model):
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
         ordering = ['id']
+        indexes = [
+            models.Index(fields=["update_at", "id"], name="materials_course_update_idx")
+        ]
 
 
 class Lesson(models.Model):
@@ -91,6 +97,12 @@ class Lesson(models.Model):
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
         ordering = ['id']
+        indexes = [
+            models.Index(fields=["course", "id"], name="materials_lesson_course_idx")
+        ]
+
+
+SUBSCRIPTION_UNIQUE_CONSTRAINT = "materials_subscription_user_course_uniq"
 
 
 class Subscription(models.Model):
@@ -107,3 +119,8 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "course"], name=SUBSCRIPTION_UNIQUE_CONSTRAINT
+            )
+        ]
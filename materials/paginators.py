@@ -1,7 +1,49 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class CustomPaginator(PageNumberPagination):
     page_size = 5
     page_size_query_param = "page_size"
     max_page_size = 10
+
+
+class CustomCursorPaginator(CursorPagination):
+    """Постраничный вывод по курсору: без OFFSET и COUNT(*), устойчив к добавлению новых записей."""
+
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 10
+    ordering = ("id",)
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Порядок задается только представлением, параметр ordering не учитывается: позиция курсора
+        строится по первому полю порядка, и неуникальное поле (например, дата) ломает обход страниц.
+        """
+        if isinstance(self.ordering, str):
+            return (self.ordering,)
+        return tuple(self.ordering)
+
+
+class CursorPaginationMixin:
+    """
+    Переключает представление на пагинацию по курсору при запросе с параметром ?pagination=cursor.
+    Порядок выдачи задается атрибутом cursor_ordering представления.
+    """
+
+    pagination_mode_query_param = "pagination"
+    cursor_pagination_class = CustomCursorPaginator
+    cursor_ordering = ("id",)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator") and self.use_cursor_pagination():
+            self._paginator = self.cursor_pagination_class()
+            self._paginator.ordering = self.cursor_ordering
+        return super().paginator
+
+    def use_cursor_pagination(self):
+        request = getattr(self, "request", None)
+        if request is None:
+            return False
+        return request.query_params.get(self.pagination_mode_query_param) == "cursor"
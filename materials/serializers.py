@@ -1,10 +1,51 @@
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import (IntegerField, ListSerializer,
+                                        ModelSerializer, SerializerMethodField,
+                                        ValidationError)
 
+from materials.cache import (course_scope, courses_scope, invalidate,
+                             lesson_scope, lessons_scope)
 from materials.models import Course, Lesson, Subscription
+from materials.services import schedule_course_notifications, touch_courses
 
 from .validators import LinkVideoValidator
 
 
+def split_query_param(request, name):
+    value = request.query_params.get(name, "")
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+def get_requested_fields(request, serializer_class):
+    """
+    Поля ответа по параметрам запроса: ?fields= выбирает поля, ?expand= раскрывает вложенные объекты
+    из expandable_fields, которые по умолчанию не выводятся. Выбор полей действует только при чтении.
+    """
+    fields = set(serializer_class.Meta.fields)
+    expandable = set(getattr(serializer_class, "expandable_fields", ()))
+    if request is None:
+        return fields - expandable
+
+    expand = split_query_param(request, "expand") & expandable
+    if request.method in SAFE_METHODS:
+        fields &= split_query_param(request, "fields") or fields
+    return (fields - expandable) | expand
+
+
+class DynamicFieldsMixin:
+    """Сериализатор выводит только поля, выбранные параметрами ?fields= и ?expand=."""
+
+    expandable_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = get_requested_fields(self.context.get("request"), type(self))
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
+
 class LessonSerializer(ModelSerializer):
     class Meta:
         model = Lesson
@@ -12,25 +53,105 @@ class LessonSerializer(ModelSerializer):
         validators = [LinkVideoValidator(field="video")]
 
 
+class LessonBulkListSerializer(ListSerializer):
+    """
+    Сохранение списка уроков: новые создаются через bulk_create, уроки с id обновляются через bulk_update
+    в одной транзакции. Дата изменения и уведомление подписчиков обновляются один раз на каждый
+    затронутый курс.
+    """
+
+    def validate(self, attrs):
+        ids = [item["id"] for item in attrs if "id" in item]
+        if len(ids) != len(set(ids)):
+            raise ValidationError("Урок не может встречаться в списке несколько раз.")
+
+        course_ids = {item["course_id"] for item in attrs if item.get("course_id")}
+        missing = course_ids - set(
+            Course.objects.filter(id__in=course_ids).values_list("id", flat=True)
+        )
+        if missing:
+            raise ValidationError(f"Курсы не найдены: {sorted(missing)}.")
+        return attrs
+
+    def create(self, validated_data):
+        owner = self.context["request"].user
+        new_lessons = [
+            Lesson(owner=owner, **item) for item in validated_data if "id" not in item
+        ]
+        changes = {item.pop("id"): item for item in validated_data if "id" in item}
+        course_ids = {lesson.course_id for lesson in new_lessons}
+
+        with transaction.atomic():
+            lessons = Lesson.objects.bulk_create(new_lessons)
+            if changes:
+                updated = Lesson.objects.select_for_update().in_bulk(list(changes))
+                fields = {"update_at"}
+                now = timezone.now()
+                for lesson_id, item in changes.items():
+                    lesson = updated[lesson_id]
+                    previous_course_id = lesson.course_id
+                    for field, value in item.items():
+                        setattr(lesson, field, value)
+                    lesson.update_at = now
+                    course_ids.update((previous_course_id, lesson.course_id))
+                    fields.update(item)
+                Lesson.objects.bulk_update(updated.values(), fields=sorted(fields))
+                lessons.extend(updated.values())
+
+            course_ids.discard(None)
+            touch_courses(*course_ids)
+            schedule_course_notifications(*course_ids)
+
+        invalidate(
+            lessons_scope(),
+            courses_scope(),
+            *(course_scope(course_id) for course_id in course_ids),
+            *(lesson_scope(lesson_id) for lesson_id in changes),
+        )
+        return lessons
+
+
+class LessonBulkSerializer(LessonSerializer):
+    """Элемент списка уроков: с id - изменение урока, без id - новый урок."""
+
+    id = IntegerField(required=False)
+    course = IntegerField(source="course_id", required=False, allow_null=True)
+
+    class Meta(LessonSerializer.Meta):
+        list_serializer_class = LessonBulkListSerializer
+        read_only_fields = ("owner", "update_at")
+
+    def validate(self, attrs):
+        if "id" not in attrs and not attrs.get("name"):
+            raise ValidationError({"name": "Обязательное поле."})
+        return super().validate(attrs)
+
+
 class SubscriptionSerializer(ModelSerializer):
     class Meta:
         model = Subscription
         fields = "__all__"
 
 
-class CourseSerializer(ModelSerializer):
+class CourseSerializer(DynamicFieldsMixin, ModelSerializer):
     count_lessons = SerializerMethodField()
     lessons = LessonSerializer(many=True, source="lesson_set", read_only=True)
     is_subscribed = SerializerMethodField()
 
     def get_count_lessons(self, course):
+        if hasattr(course, "count_lessons"):
+            return course.count_lessons
         return Lesson.objects.filter(course=course.pk).count()
 
     def get_is_subscribed(self, course):
+        if hasattr(course, "is_subscribed"):
+            return course.is_subscribed
         user = self.context.get("request").user
 
         return Subscription.objects.filter(user=user, course=course).exists()
 
+    expandable_fields = ("lessons",)
+
     class Meta:
         model = Course
         fields = (
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from materials.cache import invalidate, subscriptions_scope
+from materials.models import (SUBSCRIPTION_UNIQUE_CONSTRAINT, Course,
+                              Subscription)
+
+
+def schedule_course_notifications(*course_ids):
+    """
+    Планирование уведомления подписчиков об обновлении курсов.
+    Уведомление отправляется после периода тишины с момента последнего изменения: повторные изменения
+    лишь сдвигают время отправки, поэтому у курса не бывает больше одной ожидающей рассылки.
+    """
+    due_at = timezone.now() + settings.COURSE_NOTIFICATION_DELAY
+    Course.objects.filter(id__in=course_ids).update(notification_due_at=due_at)
+
+
+def touch_courses(*course_ids):
+    """
+    Обновление даты изменения курсов одним запросом. Дата курса учитывает и изменения его уроков,
+    поэтому по ней строятся валидаторы условных запросов к курсам.
+    """
+    Course.objects.filter(id__in=course_ids).update(update_at=timezone.now())
+
+
+def toggle_subscription(user_id, course_id):
+    """
+    Подписка на курс или отписка от него одним запросом: удаление существующей подписки с RETURNING,
+    иначе вставка с ON CONFLICT DO NOTHING по уникальному ограничению (user, course).
+    Возвращает пару (курс существует, пользователь подписан после запроса).
+    Запрос обходит сигналы модели, поэтому кеш подписок пользователя сбрасывается здесь.
+    """
+    subscription_table = connection.ops.quote_name(Subscription._meta.db_table)
+    course_table = connection.ops.quote_name(Course._meta.db_table)
+    constraint = connection.ops.quote_name(SUBSCRIPTION_UNIQUE_CONSTRAINT)
+    sql = f"""
+        WITH deleted AS (
+            DELETE FROM {subscription_table} WHERE user_id = %(user_id)s AND course_id = %(course_id)s
+            RETURNING id
+        ), inserted AS (
+            INSERT INTO {subscription_table} (user_id, course_id)
+            SELECT %(user_id)s, id FROM {course_table}
+            WHERE id = %(course_id)s AND NOT EXISTS (SELECT 1 FROM deleted)
+            ON CONFLICT ON CONSTRAINT {constraint} DO NOTHING
+            RETURNING id
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM {course_table} WHERE id = %(course_id)s),
+            NOT EXISTS (SELECT 1 FROM deleted)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"user_id": user_id, "course_id": course_id})
+        course_exists, subscribed = cursor.fetchone()
+
+    if course_exists:
+        invalidate(subscriptions_scope(user_id))
+    return course_exists, subscribed
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from materials.cache import (course_scope, courses_scope, invalidate,
+                             lesson_scope, lessons_scope, subscriptions_scope)
+from materials.models import Course, Lesson, Subscription
+
+
+def is_course_cascade(origin):
+    """Удаление вызвано удалением курса (экземпляра или набора курсов)."""
+    return isinstance(origin, Course) or getattr(origin, "model", None) is Course
+
+
+@receiver(post_save, sender=Course)
+def invalidate_course_cache(sender, instance, **kwargs):
+    """Сброс кеша курса и списка курсов при изменении курса."""
+    invalidate(courses_scope(), course_scope(instance.pk))
+
+
+@receiver(post_delete, sender=Course)
+def invalidate_deleted_course_cache(sender, instance, **kwargs):
+    """Сброс кеша курса, списка курсов и списка уроков: уроки курса удаляются вместе с ним."""
+    invalidate(courses_scope(), course_scope(instance.pk), lessons_scope())
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_cache(sender, instance, **kwargs):
+    """
+    Сброс кеша урока, списка уроков и курса урока. Перенос урока в другой курс и дата изменения
+    курсов обрабатываются в представлениях уроков. При удалении курса кеш сбрасывается один раз
+    обработчиком удаления курса.
+    """
+    if is_course_cascade(kwargs.get("origin")):
+        return
+
+    scopes = [lessons_scope(), lesson_scope(instance.pk), courses_scope()]
+    if instance.course_id:
+        scopes.append(course_scope(instance.course_id))
+    invalidate(*scopes)
+
+
+@receiver(post_save, sender=Subscription)
+def invalidate_subscription_cache(sender, instance, **kwargs):
+    """
+    Сброс закешированных ответов пользователя, зависящих от признака подписки.
+    Обработчика удаления нет, чтобы подписки удалялись вместе с курсом или пользователем одним
+    запросом: отписка через toggle_subscription сбрасывает кеш сама.
+    """
+    invalidate(subscriptions_scope(instance.user_id))
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def collect_deleted_user_scopes(sender, instance, **kwargs):
+    """
+    Области кеша уроков пользователя и их курсов (курс с ?expand=lessons выводит владельца урока).
+    После удаления владелец уже обнулен, поэтому уроки выбираются до удаления.
+    """
+    instance._cache_scopes = set()
+    for lesson_id, course_id in Lesson.objects.filter(owner=instance).values_list("id", "course_id"):
+        instance._cache_scopes.add(lesson_scope(lesson_id))
+        if course_id:
+            instance._cache_scopes.add(course_scope(course_id))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_deleted_user_cache(sender, instance, **kwargs):
+    """
+    Сброс кеша курсов и уроков при удалении пользователя: владелец его курсов и уроков
+    обнуляется, а подписки удаляются на уровне базы без сигналов по каждой записи.
+    """
+    invalidate(
+        courses_scope(),
+        lessons_scope(),
+        subscriptions_scope(instance.pk),
+        *getattr(instance, "_cache_scopes", ()),
+    )
@@ -1,41 +1,225 @@
-from datetime import timedelta
+import logging
+from itertools import islice
+from smtplib import SMTPException
+from uuid import uuid4
 
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
 from django.utils import timezone
 
 from config.settings import ADMIN_EMAIL
 from materials.models import Course, Subscription
 
+logger = logging.getLogger(__name__)
+
+
+def iter_subscription_ranges(course_id, size):
+    """
+    Потоковое разбиение подписок курса на диапазоны id по size подписок.
+    Читаются только id, в памяти одновременно находится не больше одной пачки.
+    """
+    subscription_ids = (
+        Subscription.objects.filter(course_id=course_id)
+        .order_by("id")
+        .values_list("id", flat=True)
+        .iterator(chunk_size=size)
+    )
+    for chunk in split_into_chunks(subscription_ids, size):
+        yield chunk[0], chunk[-1]
+
+
+def get_chunk_emails(course_id, first_id, last_id):
+    """Адреса подписчиков курса из диапазона id подписок."""
+    return list(
+        Subscription.objects.filter(course_id=course_id, id__range=(first_id, last_id))
+        .order_by("id")
+        .values_list("user__email", flat=True)
+    )
+
+
+def split_into_chunks(items, size):
+    """Разбиение последовательности на пачки фиксированного размера."""
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def _report_keys(report_id):
+    return {
+        name: f"materials:email_report:{report_id}:{name}"
+        for name in ("pending", "chunks", "sent", "failed")
+    }
+
+
+def _incr(key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=settings.EMAIL_REPORT_TIMEOUT)
+        return cache.incr(key, delta)
+
+
+def record_chunk_result(course_id, report_id, result):
+    """
+    Учет итога пачки в отчете рассылки. Счетчик pending хранит число незавершенных пачек
+    плюс единицу, которую снимает send_email после постановки всех пачек, поэтому отчет
+    формируется ровно один раз, когда завершилась последняя пачка.
+    """
+    keys = _report_keys(report_id)
+    _incr(keys["chunks"])
+    _incr(keys["sent"], result["sent"])
+    _incr(keys["failed"], len(result["failed"]))
+    finish_chunk(course_id, report_id)
+
+
+def finish_chunk(course_id, report_id):
+    if _incr(_report_keys(report_id)["pending"], -1) <= 0:
+        email_delivery_report.delay(course_id, report_id)
+
+
+@shared_task
+def dispatch_course_notifications():
+    """
+    Периодическая отправка уведомлений по курсам, у которых истек период тишины после изменения.
+    Отобранные курсы блокируются и снимаются с очереди в одной транзакции, поэтому параллельные
+    запуски не отправят одно уведомление дважды.
+    """
+    with transaction.atomic():
+        course_ids = list(
+            Course.objects.select_for_update(skip_locked=True)
+            .filter(notification_due_at__lte=timezone.now())
+            .order_by("notification_due_at")
+            .values_list("id", flat=True)[: settings.COURSE_NOTIFICATION_BATCH_SIZE]
+        )
+        Course.objects.filter(id__in=course_ids).update(notification_due_at=None)
+
+    for course_id in course_ids:
+        send_email.delay(course_id)
+    return f"Запущена рассылка по {len(course_ids)} курсам"
+
 
 @shared_task
 def send_email(course_id=None):
-    """Рассылка писем пользователям об обновлении материалов курса."""
+    """
+    Рассылка писем пользователям об обновлении материалов курса.
+    Подписки делятся на диапазоны id, каждый диапазон отправляется отдельной задачей, которая сама
+    загружает свои адреса. Пачки ставятся в очередь по мере чтения id, итог собирается в счетчиках
+    кеша и выводится задачей email_delivery_report.
+    """
+    course = Course.objects.filter(id=course_id).only("id", "name").first()
+    if course is None:
+        return f"Курс не найден (ID: {course_id})"
+
+    report_id = uuid4().hex
+    keys = _report_keys(report_id)
+    cache.set_many(
+        {keys["pending"]: 1, keys["chunks"]: 0, keys["sent"]: 0, keys["failed"]: 0},
+        timeout=settings.EMAIL_REPORT_TIMEOUT,
+    )
+
+    chunks = 0
+    for first_id, last_id in iter_subscription_ranges(course_id, settings.EMAIL_CHUNK_SIZE):
+        _incr(keys["pending"])
+        send_email_chunk.delay(
+            course.name, first_id, last_id, course_id=course_id, report_id=report_id
+        )
+        chunks += 1
+
+    if not chunks:
+        cache.delete_many(keys.values())
+        return f"Нет подписчиков на курс: {course.name} (ID: {course_id})"
+
+    finish_chunk(course_id, report_id)
+    return f"Уведомления поставлены в очередь для курса: {course.name} (ID: {course_id}), пачек: {chunks}"
+
+
+@shared_task(bind=True, max_retries=settings.EMAIL_CHUNK_MAX_RETRIES)
+def send_email_chunk(
+    self,
+    course_name,
+    first_id,
+    last_id,
+    course_id=None,
+    report_id=None,
+    emails=None,
+    delivered=0,
+):
+    """
+    Отправка писем подписчикам из диапазона id подписок через одно SMTP-соединение,
+    каждому получателю отдельное письмо.
+    Неотправленные адреса повторяются с экспоненциальной задержкой, после исчерпания попыток
+    возвращаются в отчете как неотправленные.
+    """
+    if emails is None:
+        emails = get_chunk_emails(course_id, first_id, last_id)
+    subject = f'Курс "{course_name}" обновлен'
+    message = (
+        f'Добрый день! Вы подписаны на обновление курса "{course_name}". Вы уже можете посмотреть '
+        f"их содержание с учетом изменений в личном кабинете."
+    )
+
+    failed = []
+    connection = get_connection()
     try:
-        course = Course.objects.get(id=course_id)
-
-        if timezone.now() - course.update_at >= timedelta(hours=4):
-            subscriptions = Subscription.objects.filter(course=course)
-            if subscriptions.exists():
-                emails = [subscription.user.email for subscription in subscriptions]
-                send_mail(
-                    subject=f'Курс "{course.name}" обновлен',
-                    message=f'Добрый день! Вы подписаны на обновление курса "{course.name}". Вы уже можете посмотреть '
-                    f"их содержание с учетом изменений в личном кабинете.",
-                    from_email=ADMIN_EMAIL,
-                    recipient_list=emails,
-                )
-                print(f"Письма отправлены {len(emails)} подписчикам")
-                return (
-                    f"Уведомления отправлены для курса: {course.name} (ID: {course_id})"
-                )
-
-            return f"Нет подписчиков на курс: {course.name} (ID: {course_id})"
-
-            course.notification_task_id = None
-            course.save()
-    except Exception as e:
-        print(f"Ошибка: {str(e)}")
-        send_email.retry(
-            args=[course_id], kwargs={"delay_hours": 1}, exc=e, countdown=3600
+        connection.open()
+    except (SMTPException, OSError):
+        failed = list(emails)
+    else:
+        try:
+            for email in emails:
+                try:
+                    delivered += connection.send_messages(
+                        [EmailMessage(subject, message, ADMIN_EMAIL, [email])]
+                    )
+                except (SMTPException, OSError):
+                    failed.append(email)
+        finally:
+            connection.close()
+
+    if failed and self.request.retries < self.max_retries:
+        countdown = get_exponential_backoff_interval(
+            factor=settings.EMAIL_RETRY_BACKOFF,
+            retries=self.request.retries,
+            maximum=settings.EMAIL_RETRY_BACKOFF_MAX,
+            full_jitter=True,
+        )
+        raise self.retry(
+            args=(course_name, first_id, last_id),
+            kwargs={
+                "course_id": course_id,
+                "report_id": report_id,
+                "emails": failed,
+                "delivered": delivered,
+            },
+            countdown=countdown,
         )
+
+    result = {"sent": delivered, "failed": failed}
+    if report_id is not None:
+        record_chunk_result(course_id, report_id, result)
+    return result
+
+
+@shared_task
+def email_delivery_report(course_id, report_id):
+    """Итоговый отчет о рассылке по всем пачкам курса."""
+    keys = _report_keys(report_id)
+    values = cache.get_many(keys.values())
+    cache.delete_many(keys.values())
+    report = {
+        "course_id": course_id,
+        "chunks": values.get(keys["chunks"], 0),
+        "sent": values.get(keys["sent"], 0),
+        "failed": values.get(keys["failed"], 0),
+    }
+    logger.info(
+        "Рассылка по курсу %s: отправлено %s, не отправлено %s",
+        course_id,
+        report["sent"],
+        report["failed"],
+    )
+    return report
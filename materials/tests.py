@@ -1,10 +1,33 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPRecipientsRefused
+from unittest.mock import patch
+
+from celery.exceptions import Retry
 from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from materials.models import Course, Lesson
-from users.models import User
+from config.middleware import QueryBudgetExceeded
+from materials.cache import invalidate
+from materials.models import (SUBSCRIPTION_UNIQUE_CONSTRAINT, Course, Lesson,
+                              Subscription)
+from materials.tasks import (dispatch_course_notifications,
+                             email_delivery_report, send_email,
+                             send_email_chunk)
+from materials.views import CourseViewSet
+from users.models import Pay, User
 
 
 class CourseTestCase(APITestCase):
@@ -47,6 +70,24 @@ class CourseTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data.get("name"), self.course.name)
 
+    def test_moderator_role_is_cached(self):
+        """Тестирование проверки роли модератора без запросов к базе на прогретом кеше."""
+        self.client.force_authenticate(user=self.user2)
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        self.client.get(url)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user2.groups.remove(self.moderators_group)
+            self.assertIsNotNone(cache.get(f"users:{self.user2.pk}:is_moderator"))
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_course_list(self):
         """Тестирование получения списка курсов"""
         url = reverse("materials:course-list")
@@ -64,20 +105,6 @@ class CourseTestCase(APITestCase):
                     "preview": None,
                     "description": None,
                     "count_lessons": 1,
-                    "lessons": [
-                        {
-                            "id": self.lesson.pk,
-                            "name": self.lesson.name,
-                            "description": None,
-                            "preview": None,
-                            "video": None,
-                            "update_at": self.lesson.update_at.isoformat().replace(
-                                "+00:00", "Z"
-                            ),
-                            "course": self.course.pk,
-                            "owner": self.user.pk,
-                        }
-                    ],
                     "is_subscribed": False,
                 }
             ],
@@ -87,6 +114,72 @@ class CourseTestCase(APITestCase):
 
         self.assertEqual(data, result)
 
+    def test_course_list_expand_lessons(self):
+        """Тестирование вывода уроков курса по параметру expand."""
+        url = reverse("materials:course-list")
+        response = self.client.get(url, {"expand": "lessons"})
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            data["results"][0]["lessons"],
+            [
+                {
+                    "id": self.lesson.pk,
+                    "name": self.lesson.name,
+                    "description": None,
+                    "preview": None,
+                    "video": None,
+                    "update_at": self.lesson.update_at.isoformat().replace(
+                        "+00:00", "Z"
+                    ),
+                    "course": self.course.pk,
+                    "owner": self.user.pk,
+                }
+            ],
+        )
+
+    def test_course_list_sparse_fields(self):
+        """Тестирование выбора полей курса без лишних столбцов и аннотаций в запросе."""
+        url = reverse("materials:course-list")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"fields": "id,name"})
+
+        self.assertEqual(
+            response.json()["results"], [{"id": self.course.pk, "name": self.course.name}]
+        )
+        course_query = next(
+            query["sql"] for query in queries if '"materials_course"."name"' in query["sql"]
+        )
+        self.assertNotIn("description", course_query)
+        self.assertNotIn("materials_lesson", course_query)
+        self.assertNotIn("materials_subscription", course_query)
+
+    def test_course_list_query_count(self):
+        """Тестирование постоянного количества запросов при получении списка курсов."""
+        url = reverse("materials:course-list")
+
+        with CaptureQueriesContext(connection) as single_course_queries:
+            self.client.get(url, {"expand": "lessons"})
+
+        for number in range(4):
+            course = Course.objects.create(name=f"Курс {number}", owner=self.user)
+            Lesson.objects.create(name=f"Урок {number}", course=course, owner=self.user)
+            Lesson.objects.create(name=f"Урок {number}.2", course=course, owner=self.user)
+            Subscription.objects.create(user=self.user, course=course)
+
+        with CaptureQueriesContext(connection) as full_page_queries:
+            response = self.client.get(url, {"expand": "lessons"})
+        data = response.json()
+
+        self.assertEqual(len(data["results"]), 5)
+        self.assertEqual(len(full_page_queries), len(single_course_queries))
+        self.assertEqual(data["results"][1]["count_lessons"], 2)
+        self.assertEqual(len(data["results"][1]["lessons"]), 2)
+        self.assertTrue(data["results"][1]["is_subscribed"])
+        self.assertFalse(data["results"][0]["is_subscribed"])
+
     def test_course_update(self):
         """Тестирование обновления информации о курсе."""
         url = reverse("materials:course-detail", args=(self.course.pk,))
@@ -98,6 +191,26 @@ class CourseTestCase(APITestCase):
 
         self.assertEqual(json_response.get("description"), data["description"])
 
+    def test_course_list_cursor_pagination_walk(self):
+        """Тестирование обхода списка курсов по курсору при одинаковой дате обновления и ее изменении."""
+        update_at = timezone.now()
+        Course.objects.bulk_create(
+            Course(name=f"Курс {number}", owner=self.user, update_at=update_at)
+            for number in range(11)
+        )
+        Course.objects.update(update_at=update_at)
+        expected_ids = list(Course.objects.order_by("id").values_list("id", flat=True))
+
+        seen_ids = []
+        url = reverse("materials:course-list") + "?pagination=cursor"
+        while url:
+            data = self.client.get(url).json()
+            seen_ids.extend(course["id"] for course in data["results"])
+            Course.objects.filter(id=seen_ids[0]).update(update_at=timezone.now())
+            url = data["next"]
+
+        self.assertEqual(seen_ids, expected_ids)
+
     def test_course_delete(self):
         """Тестирование удаления курса."""
         url = reverse("materials:course-detail", args=(self.course.pk,))
@@ -107,6 +220,55 @@ class CourseTestCase(APITestCase):
 
         self.assertEqual(Course.objects.all().count(), 0)
 
+    def test_course_delete_with_lessons(self):
+        """Тестирование удаления курса с уроками без обновления курса на каждый урок."""
+        Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {number}", course=self.course, owner=self.user)
+            for number in range(30)
+        )
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url)
+
+        course_updates = [
+            query
+            for query in queries
+            if query["sql"].startswith('UPDATE "materials_course"')
+        ]
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(course_updates, [])
+        self.assertFalse(Lesson.objects.exists())
+
+    def test_course_delete_cascade_without_per_row_signals(self):
+        """Тестирование удаления курса: подписки удаляются одним запросом, кеш сбрасывается один раз."""
+        Lesson.objects.bulk_create(
+            Lesson(name=f"Урок {number}", course=self.course, owner=self.user)
+            for number in range(10)
+        )
+        users = User.objects.bulk_create(
+            User(email=f"subscriber{number}@mail.ru") for number in range(20)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=user, course=self.course) for user in users
+        )
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+
+        with patch("materials.signals.invalidate") as mock_invalidate:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(url)
+
+        subscription_queries = [
+            query["sql"].split(" ", 1)[0]
+            for query in queries
+            if query["sql"].startswith(('SELECT "materials_subscription"', 'DELETE FROM "materials_subscription"'))
+        ]
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(subscription_queries, ["DELETE"])
+        mock_invalidate.assert_called_once()
+        self.assertFalse(Subscription.objects.exists())
+
     def test_course_delete_with_moder(self):
         """Тестирование удаления записи модератором."""
         self.client.force_authenticate(user=self.user2)
@@ -207,9 +369,34 @@ class LessonTestCase(APITestCase):
 
         self.assertEqual(data, result)
 
+    def test_lesson_list_cursor_pagination(self):
+        """Тестирование пагинации по курсору при получении списка уроков."""
+        for number in range(6):
+            Lesson.objects.create(name=f"Урок {number}", course=self.course, owner=self.user)
+
+        url = reverse("materials:lesson-list")
+        response = self.client.get(url, {"pagination": "cursor"})
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", data)
+        self.assertIsNone(data["previous"])
+        self.assertEqual(len(data["results"]), 5)
+
+        Lesson.objects.create(name="Новый урок", course=self.course, owner=self.user)
+
+        next_response = self.client.get(data["next"])
+        next_data = next_response.json()
+        first_page_ids = [lesson["id"] for lesson in data["results"]]
+        next_page_ids = [lesson["id"] for lesson in next_data["results"]]
+
+        self.assertEqual(len(next_page_ids), 3)
+        self.assertFalse(set(first_page_ids) & set(next_page_ids))
+        self.assertIsNotNone(next_data["previous"])
+
     def test_lesson_update(self):
         """Тестирование обновления информации об уроке."""
-        url = reverse("materials:lesson-update", args=(self.course.pk,))
+        url = reverse("materials:lesson-update", args=(self.lesson.pk,))
         data = {"description": "Научим создавать приложения на DRF."}
         response = self.client.patch(url, data)
         json_response = response.json()
@@ -220,7 +407,7 @@ class LessonTestCase(APITestCase):
 
     def test_lesson_delete(self):
         """Тестирование удаления урока."""
-        url = reverse("materials:lesson-delete", args=(self.course.pk,))
+        url = reverse("materials:lesson-delete", args=(self.lesson.pk,))
         response = self.client.delete(url)
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
@@ -230,13 +417,78 @@ class LessonTestCase(APITestCase):
     def test_lesson_delete_with_moder(self):
         """Тестирование удаления записи модератором."""
         self.client.force_authenticate(user=self.user2)
-        url = reverse("materials:lesson-delete", args=(self.course.pk,))
+        url = reverse("materials:lesson-delete", args=(self.lesson.pk,))
         response = self.client.delete(url)
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
         self.assertEqual(Lesson.objects.all().count(), 1)
 
+    def test_lesson_bulk_save(self):
+        """Тестирование пакетного создания и изменения уроков с одним уведомлением на курс."""
+        url = reverse("materials:lesson-bulk")
+        other_course = Course.objects.create(name="Java-разработка", owner=self.user)
+        update_at = Course.objects.get(pk=self.course.pk).update_at
+        data = [
+            {"id": self.lesson.pk, "name": "Celery", "course": other_course.pk},
+            {"name": "Redis", "course": self.course.pk, "video": "youtube.com/redis/"},
+            {"name": "Docker", "course": self.course.pk},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(lesson["name"] for lesson in response.json()),
+            ["Celery", "Docker", "Redis"],
+        )
+        self.assertEqual(Lesson.objects.filter(course=self.course).count(), 2)
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).course, other_course)
+        self.assertEqual(Lesson.objects.filter(owner=self.user).count(), 3)
+        courses = Course.objects.filter(pk__in=[self.course.pk, other_course.pk])
+        self.assertTrue(all(course.notification_due_at for course in courses))
+        self.assertGreater(courses.get(pk=self.course.pk).update_at, update_at)
+        self.assertEqual(
+            len([query for query in queries if query["sql"].startswith("UPDATE")]), 3
+        )
+
+    def test_lesson_bulk_save_is_atomic(self):
+        """Тестирование отказа в сохранении всего списка при ошибке в одном уроке."""
+        url = reverse("materials:lesson-bulk")
+        data = [
+            {"name": "Redis", "course": self.course.pk},
+            {"name": "Docker", "video": "my.com/lesson/1/"},
+            {"name": "Kafka", "course": self.course.pk + 100},
+        ]
+
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, data[::2], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Lesson.objects.count(), 1)
+
+    def test_lesson_bulk_save_permissions(self):
+        """Тестирование прав пакетного сохранения: модератор не создает уроки, чужие уроки не изменяются."""
+        url = reverse("materials:lesson-bulk")
+        stranger = User.objects.create(email="stranger@mail.ru")
+        self.client.force_authenticate(user=self.user2)
+
+        create_response = self.client.post(url, [{"name": "Redis"}], format="json")
+        update_response = self.client.post(
+            url, [{"id": self.lesson.pk, "name": "Celery"}], format="json"
+        )
+        self.client.force_authenticate(user=stranger)
+        stranger_response = self.client.post(
+            url, [{"id": self.lesson.pk, "name": "Kafka"}], format="json"
+        )
+
+        self.assertEqual(create_response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(update_response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(stranger_response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).name, "Celery")
+
 
 class SubscriptionTestCase(APITestCase):
     def setUp(self):
@@ -282,3 +534,426 @@ class SubscriptionTestCase(APITestCase):
         self.assertEqual(json_response2["message"], "Подписка удалена")
 
         self.assertEqual(course_json_response["results"][0]["is_subscribed"], False)
+
+    def test_subscription_toggle_single_query(self):
+        """Тестирование переключения подписки одним запросом к базе."""
+        url = reverse("materials:subscription")
+
+        with self.assertNumQueries(1):
+            self.client.post(url, {"course_id": self.course.pk})
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {"course_id": self.course.pk})
+
+        self.assertEqual(response.json()["message"], "Подписка удалена")
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_subscription_is_unique(self):
+        """Тестирование запрета повторной подписки пользователя на курс."""
+        Subscription.objects.create(user=self.user, course=self.course)
+
+        with self.assertRaises(IntegrityError):
+            Subscription.objects.create(user=self.user, course=self.course)
+
+    def test_subscribe_to_missing_course(self):
+        """Тестирование подписки на несуществующий курс."""
+        url = reverse("materials:subscription")
+
+        response = self.client.post(url, {"course_id": self.course.pk + 1})
+        invalid_response = self.client.post(url, {"course_id": "abc"})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(invalid_response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Subscription.objects.exists())
+
+
+class CourseCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="admin@mail.ru")
+        self.user2 = User.objects.create(email="user2@mail.ru")
+        self.course = Course.objects.create(name="Python-разработка", owner=self.user)
+        self.lesson = Lesson.objects.create(
+            name="Django REST Framework", course=self.course, owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_list_served_from_cache(self):
+        """Тестирование повторного получения списка курсов из кеша без запросов к базе."""
+        url = reverse("materials:course-list")
+        first_response = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second_response = self.client.get(url)
+
+        self.assertEqual(first_response.json(), second_response.json())
+
+    def test_lesson_update_invalidates_course_cache(self):
+        """Тестирование сброса кеша курса при изменении урока."""
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        self.client.get(url)
+
+        update_url = reverse("materials:lesson-update", args=(self.lesson.pk,))
+        self.client.patch(update_url, {"name": "Celery"})
+
+        response = self.client.get(url, {"expand": "lessons"})
+
+        self.assertEqual(response.json()["lessons"][0]["name"], "Celery")
+
+    def test_user_delete_invalidates_cache(self):
+        """Тестирование однократного сброса кеша курсов и уроков при удалении владельца."""
+        self.user2.groups.add(Group.objects.create(name="Модератор"))
+        self.client.force_authenticate(user=self.user2)
+        course_url = reverse("materials:course-list")
+        lesson_url = reverse("materials:lesson-list")
+        lesson_detail_url = reverse("materials:lesson-detail", args=(self.lesson.pk,))
+        course_detail_url = reverse("materials:course-detail", args=(self.course.pk,))
+        self.client.get(course_url)
+        self.client.get(lesson_url)
+        self.client.get(lesson_detail_url)
+        self.client.get(course_detail_url, {"expand": "lessons"})
+
+        with patch("materials.signals.invalidate", wraps=invalidate) as mock_invalidate:
+            self.user.delete()
+
+        with CaptureQueriesContext(connection) as course_queries:
+            self.client.get(course_url)
+        course_query_count = len(course_queries)
+        lesson_response = self.client.get(lesson_url)
+        lesson_detail_response = self.client.get(lesson_detail_url)
+        course_detail_response = self.client.get(course_detail_url, {"expand": "lessons"})
+
+        mock_invalidate.assert_called_once()
+        self.assertGreater(course_query_count, 0)
+        self.assertIsNone(lesson_response.json()["results"][0]["owner"])
+        self.assertIsNone(lesson_detail_response.json()["owner"])
+        self.assertIsNone(course_detail_response.json()["lessons"][0]["owner"])
+
+    def test_subscription_cache_is_per_user(self):
+        """Тестирование разделения кеша по пользователям для признака подписки."""
+        url = reverse("materials:course-list")
+        self.client.get(url)
+
+        self.client.force_authenticate(user=self.user2)
+        self.client.get(url)
+        self.client.post(reverse("materials:subscription"), {"course_id": self.course.pk})
+        user2_response = self.client.get(url)
+
+        self.client.force_authenticate(user=self.user)
+        user_response = self.client.get(url)
+
+        self.assertTrue(user2_response.json()["results"][0]["is_subscribed"])
+        self.assertFalse(user_response.json()["results"][0]["is_subscribed"])
+
+    def test_cache_stats(self):
+        """Тестирование счетчиков попаданий и промахов кеша."""
+        url = reverse("materials:lesson-list")
+        stats_url = reverse("materials:cache-stats")
+        self.user.is_staff = True
+        self.user.save()
+
+        before = self.client.get(stats_url).json()
+        self.client.get(url)
+        self.client.get(url)
+        after = self.client.get(stats_url).json()
+
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="admin@mail.ru")
+        self.course = Course.objects.create(name="Python-разработка", owner=self.user)
+        self.lesson = Lesson.objects.create(
+            name="Django REST Framework", course=self.course, owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_course_list_not_modified(self):
+        """Тестирование ответа 304 на повторный запрос списка курсов с тем же ETag."""
+        url = reverse("materials:course-list")
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_course_list_etag_changes_after_changes(self):
+        """Тестирование нового ETag списка курсов после изменения уроков в обход представлений и подписки."""
+        url = reverse("materials:course-list")
+        etag = self.client.get(url)["ETag"]
+
+        Lesson.objects.create(name="Celery", course=self.course, owner=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["results"][0]["count_lessons"], 2)
+
+        etag = response["ETag"]
+        self.client.post(reverse("materials:subscription"), {"course_id": self.course.pk})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()["results"][0]["is_subscribed"])
+
+    @override_settings(CACHE_ENABLED=False)
+    def test_course_not_modified_without_cache(self):
+        """Тестирование ответа 304 после одного запроса к базе без кеша ответов."""
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_etag_changes_after_lesson_update(self):
+        """Тестирование нового ETag курса после изменения урока и подписки."""
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        etag = self.client.get(url)["ETag"]
+
+        update_url = reverse("materials:lesson-update", args=(self.lesson.pk,))
+        self.client.patch(update_url, {"name": "Celery"})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        self.client.post(reverse("materials:subscription"), {"course_id": self.course.pk})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()["is_subscribed"])
+
+    def test_course_etag_changes_after_lesson_move(self):
+        """Тестирование нового ETag обоих курсов после переноса урока в другой курс."""
+        other_course = Course.objects.create(name="Go-разработка", owner=self.user)
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        other_url = reverse("materials:course-detail", args=(other_course.pk,))
+        etag = self.client.get(url)["ETag"]
+        other_etag = self.client.get(other_url)["ETag"]
+
+        update_url = reverse("materials:lesson-update", args=(self.lesson.pk,))
+        self.client.patch(update_url, {"course": other_course.pk})
+
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK
+        )
+        self.assertEqual(
+            self.client.get(other_url, HTTP_IF_NONE_MATCH=other_etag).status_code,
+            status.HTTP_200_OK,
+        )
+
+    def test_lesson_not_modified_since(self):
+        """Тестирование ответа 304 на запрос урока с If-Modified-Since."""
+        url = reverse("materials:lesson-detail", args=(self.lesson.pk,))
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_not_modified_since_ignored(self):
+        """Тестирование отсутствия Last-Modified у курсов: подписка и удаление курса не меняют дату курсов."""
+        other_course = Course.objects.create(name="Go-разработка", owner=self.user)
+        Course.objects.filter(pk=self.course.pk).update(update_at=timezone.now() - timedelta(days=1))
+        detail_url = reverse("materials:course-detail", args=(other_course.pk,))
+        list_url = reverse("materials:course-list")
+        since = http_date(time.time() + 60)
+
+        self.assertNotIn("Last-Modified", self.client.get(detail_url))
+        self.assertNotIn("Last-Modified", self.client.get(list_url))
+
+        self.client.post(reverse("materials:subscription"), {"course_id": other_course.pk})
+        response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=since)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()["is_subscribed"])
+
+        self.client.delete(reverse("materials:course-detail", args=(self.course.pk,)))
+        response = self.client.get(list_url, HTTP_IF_MODIFIED_SINCE=since)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 1)
+
+    def test_course_etag_changes_after_lesson_change_outside_views(self):
+        """Тестирование нового ETag курса после изменения уроков в обход представлений."""
+        url = reverse("materials:course-detail", args=(self.course.pk,))
+        etag = self.client.get(url)["ETag"]
+
+        Lesson.objects.create(name="Celery", course=self.course, owner=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count_lessons"], 2)
+
+        etag = response["ETag"]
+        self.lesson.name = "Django ORM"
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class QueryStatsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="admin@mail.ru")
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(DEBUG=True)
+    def test_query_stats_headers(self):
+        """Тестирование заголовков с количеством запросов и временем обработки в режиме отладки."""
+        response = self.client.get(reverse("materials:lesson-list"))
+
+        self.assertEqual(response["X-Query-Count"], "2")
+        self.assertIn("X-DB-Time", response)
+        self.assertIn("X-Response-Time", response)
+
+    def test_query_budget_exceeded(self):
+        """Тестирование ошибки при превышении бюджета запросов представления."""
+        url = reverse("materials:course-list")
+        budget = {**CourseViewSet.query_budget, "list": 1}
+
+        with patch.object(CourseViewSet, "query_budget", budget):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(url)
+
+
+@override_settings(EMAIL_CHUNK_SIZE=2)
+class CourseNotificationTestCase(APITestCase):
+    def setUp(self):
+        self.course = Course.objects.create(name="Python-разработка")
+        self.emails = ["first@mail.ru", "second@mail.ru", "third@mail.ru"]
+        for email in self.emails:
+            user = User.objects.create(email=email)
+            Subscription.objects.create(user=user, course=self.course)
+
+    def test_send_email_in_chunks(self):
+        """Тестирование рассылки отдельных писем подписчикам пачками по диапазонам id подписок."""
+        subscription_ids = list(
+            Subscription.objects.order_by("id").values_list("id", flat=True)
+        )
+        with patch.object(
+            send_email_chunk, "delay", wraps=send_email_chunk.delay
+        ) as chunk_delay, patch.object(
+            email_delivery_report, "run", wraps=email_delivery_report.run
+        ) as report, self.assertLogs("materials.tasks", level="INFO") as logs:
+            send_email.delay(self.course.pk)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox), sorted(self.emails)
+        )
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+        self.assertEqual(
+            [call.args[1:] for call in chunk_delay.call_args_list],
+            [
+                (subscription_ids[0], subscription_ids[1]),
+                (subscription_ids[2], subscription_ids[2]),
+            ],
+        )
+        report.assert_called_once()
+        self.assertIn("отправлено 3, не отправлено 0", logs.output[-1])
+
+    def test_failed_chunk_is_retried(self):
+        """Тестирование повторной отправки только неотправленных адресов пачки."""
+        send_messages = EmailBackend.send_messages
+        first_id, last_id = (
+            Subscription.objects.order_by("id").values_list("id", flat=True)[i]
+            for i in (0, 2)
+        )
+
+        def flaky_send_messages(backend, messages):
+            if messages[0].to == ["second@mail.ru"]:
+                raise SMTPRecipientsRefused({"second@mail.ru": (550, b"busy")})
+            return send_messages(backend, messages)
+
+        with patch.object(EmailBackend, "send_messages", flaky_send_messages):
+            with self.assertRaises(Retry) as retry:
+                send_email_chunk.apply(
+                    args=("Python-разработка", first_id, last_id),
+                    kwargs={"course_id": self.course.pk},
+                )
+
+            result = send_email_chunk.apply(
+                args=("Python-разработка", first_id, last_id),
+                kwargs={"emails": ["second@mail.ru"], "delivered": 2},
+                retries=send_email_chunk.max_retries,
+            ).get()
+
+        self.assertEqual(retry.exception.sig.args, ("Python-разработка", first_id, last_id))
+        self.assertEqual(
+            retry.exception.sig.kwargs,
+            {
+                "course_id": self.course.pk,
+                "report_id": None,
+                "emails": ["second@mail.ru"],
+                "delivered": 2,
+            },
+        )
+        self.assertEqual(result, {"sent": 2, "failed": ["second@mail.ru"]})
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_notifications_are_debounced(self):
+        """Тестирование объединения нескольких изменений курса в одно уведомление."""
+        owner = User.objects.create(email="owner@mail.ru")
+        Course.objects.filter(pk=self.course.pk).update(owner=owner)
+        lesson = Lesson.objects.create(name="Урок", course=self.course, owner=owner)
+        self.client.force_authenticate(user=owner)
+
+        self.client.patch(
+            reverse("materials:course-detail", args=(self.course.pk,)), {"name": "Python"}
+        )
+        self.client.patch(reverse("materials:lesson-update", args=(lesson.pk,)), {"name": "Celery"})
+        self.client.patch(
+            reverse("materials:course-detail", args=(self.course.pk,)), {"name": "Python 3"}
+        )
+        self.course.refresh_from_db()
+
+        self.assertGreater(self.course.notification_due_at, timezone.now() + timedelta(hours=3))
+
+        dispatch_course_notifications()
+        self.assertEqual(len(mail.outbox), 0)
+
+        Course.objects.filter(pk=self.course.pk).update(
+            notification_due_at=timezone.now() - timedelta(minutes=1)
+        )
+        dispatch_course_notifications()
+        dispatch_course_notifications()
+        self.course.refresh_from_db()
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIsNone(self.course.notification_due_at)
+
+
+class HotPathIndexTestCase(APITestCase):
+    def test_explain_hot_paths_compare(self):
+        """Тестирование сравнения планов запросов с индексами горячих путей и без них."""
+        out = StringIO()
+        call_command("explain_hot_paths", "--compare", stdout=out)
+        output = out.getvalue()
+
+        with_indexes, without_indexes = output.split("Без индексов")
+        self.assertIn(SUBSCRIPTION_UNIQUE_CONSTRAINT, with_indexes)
+        self.assertIn("users_pay_user_date_idx", with_indexes)
+        self.assertNotIn(SUBSCRIPTION_UNIQUE_CONSTRAINT, without_indexes)
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Subscription._meta.db_table
+            )
+        self.assertIn(SUBSCRIPTION_UNIQUE_CONSTRAINT, constraints)
+
+    def test_pay_session_id_single_index(self):
+        """Тестирование единственного индекса по session_id без индекса для поиска по шаблону."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Pay._meta.db_table)
+        session_indexes = [
+            name
+            for name, details in constraints.items()
+            if details["columns"] == ["session_id"]
+        ]
+
+        self.assertEqual(session_indexes, ["users_pay_session_id_idx"])
@@ -2,7 +2,8 @@ from django.urls import path
 from rest_framework.routers import SimpleRouter
 
 from materials.apps import MaterialsConfig
-from materials.views import (CourseViewSet, LessonCreateAPIView,
+from materials.views import (CacheStatsAPIView, CourseViewSet,
+                             LessonBulkAPIView, LessonCreateAPIView,
                              LessonDestroyAPIView, LessonListAPIView,
                              LessonRetrieveAPIView, LessonUpdateAPIView,
                              SubscriptionAPIView)
@@ -15,6 +16,7 @@ router.register("", CourseViewSet)
 urlpatterns = [
     path("lessons/", LessonListAPIView.as_view(), name="lesson-list"),
     path("lessons/create/", LessonCreateAPIView.as_view(), name="lesson-create"),
+    path("lessons/bulk/", LessonBulkAPIView.as_view(), name="lesson-bulk"),
     path("lessons/<int:pk>/", LessonRetrieveAPIView.as_view(), name="lesson-detail"),
     path(
         "lessons/<int:pk>/update/", LessonUpdateAPIView.as_view(), name="lesson-update"
@@ -23,6 +25,7 @@ urlpatterns = [
         "lessons/<int:pk>/delete/", LessonDestroyAPIView.as_view(), name="lesson-delete"
     ),
     path("subscription/", SubscriptionAPIView.as_view(), name="subscription"),
+    path("cache/stats/", CacheStatsAPIView.as_view(), name="cache-stats"),
 ]
 
 urlpatterns += router.urls
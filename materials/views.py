@@ -1,21 +1,31 @@
-from celery.result import AsyncResult
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
+import time
+
+from django.conf import settings
+from django.db.models import Count, Exists, Max, OuterRef
+from django.http import Http404
 from django.utils.decorators import method_decorator
 from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
-                                     ListAPIView, RetrieveAPIView,
-                                     UpdateAPIView)
-from rest_framework.permissions import IsAuthenticated
+                                     GenericAPIView, ListAPIView,
+                                     RetrieveAPIView, UpdateAPIView)
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from materials.cache import (CachedResponseMixin, ConditionalGetMixin,
+                             course_scope, courses_scope, get_cache_stats,
+                             get_versions, invalidate, lesson_scope,
+                             lessons_scope, subscriptions_scope)
 from materials.models import Course, Lesson, Subscription
-from materials.paginators import CustomPaginator
-from materials.serializers import CourseSerializer, LessonSerializer
-from materials.tasks import send_email
-from users.permissions import IsModer, IsOwner
+from materials.paginators import CursorPaginationMixin, CustomPaginator
+from materials.serializers import (CourseSerializer, LessonBulkSerializer,
+                                   LessonSerializer, get_requested_fields)
+from materials.services import (schedule_course_notifications,
+                                toggle_subscription, touch_courses)
+from users.permissions import IsModer, IsOwner, is_moderator
 
 
 @method_decorator(
@@ -23,7 +33,9 @@ from users.permissions import IsModer, IsOwner
     decorator=swagger_auto_schema(
         operation_summary="Список курсов",
         operation_description="Получение списка всех курсов. Реализована пагинация по 5 объектов на странице. "
-        "Максимально - 10 объектов на странице.",
+        "Максимально - 10 объектов на странице. С параметром pagination=cursor используется пагинация по курсору "
+        "(порядок по id). Параметр fields задает выводимые поля через запятую, "
+        "expand=lessons добавляет уроки курса.",
     ),
 )
 @method_decorator(
@@ -37,7 +49,8 @@ from users.permissions import IsModer, IsOwner
     name="retrieve",
     decorator=swagger_auto_schema(
         operation_summary="Просмотр курса",
-        operation_description="Просмотр детальной информации о курсе. Требуются права владельца или модератора.",
+        operation_description="Просмотр детальной информации о курсе. Требуются права владельца или модератора. "
+        "Параметр fields задает выводимые поля через запятую, expand=lessons добавляет уроки курса.",
     ),
 )
 @method_decorator(
@@ -62,10 +75,98 @@ from users.permissions import IsModer, IsOwner
         "Требуются права владельца, не доступно для модератора.",
     ),
 )
-class CourseViewSet(ModelViewSet):
+class CourseViewSet(
+    ConditionalGetMixin, CachedResponseMixin, CursorPaginationMixin, ModelViewSet
+):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     pagination_class = CustomPaginator
+    cache_per_user = True
+    permission_fields = ("id", "owner", "update_at")
+    query_budget = {
+        "list": 5,
+        "retrieve": 4,
+        "create": 6,
+        "update": 4,
+        "partial_update": 4,
+        "destroy": 10,
+    }
+
+    def get_user_subscriptions(self):
+        return Subscription.objects.filter(
+            user_id=self.request.user.pk, course_id=OuterRef("pk")
+        )
+
+    def get_queryset(self):
+        """
+        Запрос содержит только выбранные в ?fields= столбцы и аннотации: количество уроков и признак
+        подписки считаются в одном запросе, уроки подгружаются заранее только при ?expand=lessons.
+        """
+        fields = get_requested_fields(self.request, self.get_serializer_class())
+        queryset = super().get_queryset().order_by("id")
+        if "count_lessons" in fields:
+            queryset = queryset.annotate(count_lessons=Count("lesson"))
+        if "is_subscribed" in fields:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(self.get_user_subscriptions())
+            )
+        if "lessons" in fields:
+            queryset = queryset.prefetch_related("lesson_set")
+        if self.action in ("list", "retrieve"):
+            columns = {field.name for field in Course._meta.concrete_fields} & fields
+            queryset = queryset.only(*columns, *self.permission_fields)
+        return queryset
+
+    def get_permission_queryset(self):
+        queryset = (
+            super()
+            .get_permission_queryset()
+            .annotate(is_subscribed=Exists(self.get_user_subscriptions()))
+        )
+        if self.action == "retrieve":
+            queryset = queryset.annotate(
+                lessons=Count("lesson"), lessons_update_at=Max("lesson__update_at")
+            )
+        return queryset
+
+    def get_validator_state(self):
+        """
+        Ответ зависит не только от дат курсов: от подписок пользователя, уроков и удаленных курсов.
+        Поэтому Last-Modified не отдается. ETag курса строится по его дате, урокам и подписке, ETag списка -
+        по версиям областей кеша, которые меняются при любом изменении курсов, уроков и подписок
+        (без запросов к базе). Без кеша версии не ведутся, и ETag списка каждый раз новый.
+        """
+        if self.action == "retrieve":
+            course = self.get_permission_object()
+            return None, [
+                course.pk,
+                course.update_at,
+                course.is_subscribed,
+                course.lessons,
+                course.lessons_update_at,
+            ]
+
+        if not settings.CACHE_ENABLED:
+            return None, [time.time_ns()]
+        return None, get_versions(self.get_cache_scopes())
+
+    def get_cache_scopes(self):
+        scopes = [subscriptions_scope(self.request.user.pk)]
+        if self.action == "retrieve":
+            scopes.append(course_scope(self.kwargs["pk"]))
+        else:
+            scopes.append(courses_scope())
+        return scopes
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.conditional_response, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.conditional_response, super().retrieve, request, *args, **kwargs
+        )
 
     def get_permissions(self):
         if self.action in ["create", "destroy"]:
@@ -77,23 +178,11 @@ class CourseViewSet(ModelViewSet):
         return super().get_permissions()
 
     def perform_create(self, serializer):
-        course = serializer.save()
-        course.owner = self.request.user
-        course.save()
+        serializer.save(owner=self.request.user)
 
     def perform_update(self, serializer):
         instance = serializer.save()
-        self.schedule_notification(instance.id)
-
-    def schedule_notification(self, course_id):
-        course = Course.objects.get(id=course_id)
-        if course.notification_task_id:
-            AsyncResult(course.notification_task_id).revoke(terminate=True)
-
-        result = send_email.apply_async(args=[course_id], countdown=4 * 60 * 60)
-
-        course.notification_task_id = result.id
-        course.save()
+        schedule_course_notifications(instance.id)
 
 
 @method_decorator(
@@ -107,12 +196,61 @@ class LessonCreateAPIView(CreateAPIView):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = (~IsModer, IsAuthenticated)
+    query_budget = 4
 
     def perform_create(self, serializer):
-        lesson = serializer.save()
-        lesson.owner = self.request.user
-        lesson.update_at = timezone.now().replace(second=0, microsecond=0)
-        lesson.save()
+        lesson = serializer.save(owner=self.request.user)
+        if lesson.course_id:
+            touch_courses(lesson.course_id)
+
+
+@method_decorator(
+    name="post",
+    decorator=swagger_auto_schema(
+        operation_summary="Пакетное сохранение уроков",
+        operation_description="Создание и редактирование списка уроков одним запросом: элементы без id создаются, "
+        "элементы с id обновляются. Создание запрещено для модераторов, изменять можно только свои уроки "
+        "или уроки с правами модератора. Все изменения сохраняются в одной транзакции.",
+        request_body=LessonBulkSerializer(many=True),
+        responses={201: LessonSerializer(many=True)},
+    ),
+)
+class LessonBulkAPIView(GenericAPIView):
+    queryset = Lesson.objects.all()
+    serializer_class = LessonBulkSerializer
+    permission_classes = (
+        IsAuthenticated,
+        IsModer | IsOwner,
+    )
+    query_budget = 11
+
+    def check_bulk_permissions(self, items):
+        """Права на создание уроков и на изменение каждого из уроков списка (одним запросом)."""
+        ids = [item["id"] for item in items if "id" in item]
+        if len(ids) < len(items) and is_moderator(self.request):
+            self.permission_denied(self.request, message=IsModer.message)
+
+        lessons = Lesson.objects.only("id", "owner").in_bulk(ids)
+        missing = set(ids) - set(lessons)
+        if missing:
+            raise ValidationError(f"Уроки не найдены: {sorted(missing)}.")
+        for lesson in lessons.values():
+            self.check_object_permissions(self.request, lesson)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            partial=True,
+            allow_empty=False,
+            max_length=settings.LESSON_BULK_MAX_SIZE,
+        )
+        serializer.is_valid(raise_exception=True)
+        self.check_bulk_permissions(serializer.validated_data)
+        lessons = serializer.save()
+        return Response(
+            LessonSerializer(lessons, many=True).data, status=status.HTTP_201_CREATED
+        )
 
 
 @method_decorator(
@@ -120,13 +258,30 @@ class LessonCreateAPIView(CreateAPIView):
     decorator=swagger_auto_schema(
         operation_summary="Список уроков",
         operation_description="Получение списка всех уроков. Требуются авторизация. Реализована пагинация по 5 "
-        "объектов на страницу, максимально - 10 уроков на странице.",
+        "объектов на страницу, максимально - 10 уроков на странице. С параметром pagination=cursor используется "
+        "пагинация по курсору (порядок по id).",
     ),
 )
-class LessonListAPIView(ListAPIView):
+class LessonListAPIView(
+    ConditionalGetMixin, CachedResponseMixin, CursorPaginationMixin, ListAPIView
+):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     pagination_class = CustomPaginator
+    query_budget = 4
+
+    def get_cache_scopes(self):
+        return [lessons_scope()]
+
+    def get_validator_state(self):
+        """Удаление урока не меняет дату последнего изменения, поэтому список проверяется только по ETag."""
+        stats = Lesson.objects.aggregate(lessons=Count("id"), update_at=Max("update_at"))
+        return None, [stats["lessons"], stats["update_at"]]
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.conditional_response, super().list, request, *args, **kwargs
+        )
 
 
 @method_decorator(
@@ -137,13 +292,27 @@ class LessonListAPIView(ListAPIView):
         "модераторов и владельцев.",
     ),
 )
-class LessonRetrieveAPIView(RetrieveAPIView):
+class LessonRetrieveAPIView(ConditionalGetMixin, CachedResponseMixin, RetrieveAPIView):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = (
         IsAuthenticated,
         IsModer | IsOwner,
     )
+    permission_fields = ("id", "owner", "update_at")
+    query_budget = 4
+
+    def get_cache_scopes(self):
+        return [lesson_scope(self.kwargs["pk"])]
+
+    def get_validator_state(self):
+        lesson = self.get_permission_object()
+        return lesson.update_at, [lesson.pk]
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            self.conditional_response, super().retrieve, request, *args, **kwargs
+        )
 
 
 @method_decorator(
@@ -169,15 +338,19 @@ class LessonUpdateAPIView(UpdateAPIView):
         IsAuthenticated,
         IsModer | IsOwner,
     )
+    query_budget = 6
 
     def perform_update(self, serializer):
+        previous_course_id = serializer.instance.course_id
         lesson = serializer.save()
 
-        if lesson.course:
-            lesson.course.update_at = timezone.now().replace(second=0, microsecond=0)
-            lesson.update_at = timezone.now().replace(second=0, microsecond=0)
-            lesson.course.save()
-            CourseViewSet().schedule_notification(lesson.course.id)
+        course_ids = {previous_course_id, lesson.course_id} - {None}
+        if course_ids:
+            touch_courses(*course_ids)
+        if previous_course_id not in (None, lesson.course_id):
+            invalidate(course_scope(previous_course_id))
+        if lesson.course_id:
+            schedule_course_notifications(lesson.course_id)
 
 
 @method_decorator(
@@ -194,6 +367,13 @@ class LessonDestroyAPIView(DestroyAPIView):
         IsAuthenticated,
         ~IsModer | IsOwner,
     )
+    query_budget = 6
+
+    def perform_destroy(self, instance):
+        course_id = instance.course_id
+        instance.delete()
+        if course_id:
+            touch_courses(course_id)
 
 
 @method_decorator(
@@ -205,17 +385,34 @@ class LessonDestroyAPIView(DestroyAPIView):
     ),
 )
 class SubscriptionAPIView(APIView):
+    query_budget = 2
+
     def post(self, *args, **kwargs):
         user = self.request.user
-        course_id = self.request.data.get("course_id")
-        course_item = get_object_or_404(Course, id=course_id)
+        try:
+            course_id = int(self.request.data.get("course_id"))
+        except (TypeError, ValueError):
+            raise Http404
 
-        subs_item = Subscription.objects.filter(user=user, course=course_item)
+        course_exists, subscribed = toggle_subscription(user.pk, course_id)
+        if not course_exists:
+            raise Http404
 
-        if subs_item.exists():
-            subs_item.delete()
-            message = "Подписка удалена"
-        else:
-            Subscription.objects.create(user=user, course=course_item)
-            message = "Подписка добавлена"
+        message = "Подписка добавлена" if subscribed else "Подписка удалена"
         return Response({"message": message})
+
+
+@method_decorator(
+    name="get",
+    decorator=swagger_auto_schema(
+        operation_summary="Статистика кеша",
+        operation_description="Количество попаданий и промахов кеша ответов для курсов и уроков. "
+        "Доступно только администратору.",
+    ),
+)
+class CacheStatsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+    query_budget = 1
+
+    def get(self, *args, **kwargs):
+        return Response(get_cache_stats())
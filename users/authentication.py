@@ -0,0 +1,49 @@
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+USER_CLAIMS = ("email", "is_staff", "is_superuser")
+
+
+def add_user_claims(token, user, is_moderator):
+    """Добавление в токен утверждений о пользователе для аутентификации без запроса к базе."""
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token["is_moderator"] = is_moderator
+    return token
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без загрузки пользователя из базы.
+    Пользователь собирается из утверждений токена: id, email, флаги staff/superuser и модератора.
+    Остальные поля отложены и загружаются из базы при первом обращении к ним.
+    Токены без утверждений обрабатываются как в JWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        values = {claim: validated_token[claim] for claim in USER_CLAIMS}
+        values.update({"id": user_id, "is_active": True})
+        field_names = [
+            field.attname
+            for field in User._meta.concrete_fields
+            if field.attname in values
+        ]
+        user = User.from_db(
+            router.db_for_read(User),
+            field_names,
+            [values[name] for name in field_names],
+        )
+        user.is_moderator_claim = validated_token.get("is_moderator", False)
+        return user
@@ -0,0 +1,17 @@
+from django_filters import CharFilter, FilterSet
+
+from .models import User
+
+
+class UserFilter(FilterSet):
+    """
+    Поиск пользователей по началу email или города. Поиск чувствителен к регистру, чтобы использовать
+    индексы varchar_pattern_ops по этим полям.
+    """
+
+    email = CharFilter(lookup_expr="startswith")
+    city = CharFilter(lookup_expr="startswith")
+
+    class Meta:
+        model = User
+        fields = ("email", "city")
@@ -0,0 +1,346 @@
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+
+import requests
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+SCENARIO = (
+    ("course_list", 30),
+    ("course_detail", 15),
+    ("lesson_list", 10),
+    ("lesson_crud", 15),
+    ("subscription_toggle", 15),
+    ("payment_create", 10),
+    ("token_refresh", 5),
+)
+STUB_SERVER_ENV = {
+    "STRIPE_CLIENT": "users.services.StubStripeClient",
+    "EXCHANGE_RATE_SOURCE": "users.services.FixedRateSource",
+}
+LESSON_VIDEO = "https://www.youtube.com/watch?v=benchmark"
+PAYMENT_AMOUNTS = (990, 4900, 15000)
+
+
+def percentile(values, percent):
+    """Перцентиль по отсортированному списку значений (метод ближайшего ранга)."""
+    index = max(math.ceil(len(values) * percent / 100) - 1, 0)
+    return values[index]
+
+
+def summarize(samples, elapsed):
+    """Сводка по конечным точкам: количество запросов, ошибки, запросов в секунду и перцентили задержки в мс."""
+
+    def stats(records):
+        latencies = sorted(latency for latency, _ in records)
+        return {
+            "requests": len(records),
+            "errors": sum(not ok for _, ok in records),
+            "rps": round(len(records) / elapsed, 2) if elapsed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    endpoints = {label: stats(records) for label, records in sorted(samples.items())}
+    everything = [record for records in samples.values() for record in records]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total": stats(everything) if everything else None,
+        "endpoints": endpoints,
+    }
+
+
+class VirtualUser:
+    """
+    Клиент нагрузочного теста: авторизуется под своим пользователем, создает свой курс
+    и выполняет действия сценария, выбирая их случайно по весам SCENARIO.
+    """
+
+    def __init__(self, base_url, email, password, seed):
+        self.base_url = base_url.rstrip("/")
+        self.email = email
+        self.password = password
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.samples = defaultdict(list)
+        self.course_ids = []
+        self.course_id = None
+        self.next_courses = None
+        self.refresh = None
+
+    def request(self, label, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.samples[label].append((time.perf_counter() - started, False))
+            return None
+        self.samples[label].append((time.perf_counter() - started, response.ok))
+        return response if response.ok else None
+
+    def login(self):
+        response = self.request(
+            "POST /users/token/",
+            "post",
+            "/users/token/",
+            json={"email": self.email, "password": self.password},
+        )
+        if response is None:
+            raise CommandError(f"Не удалось авторизоваться под {self.email}.")
+        tokens = response.json()
+        self.refresh = tokens["refresh"]
+        self.session.headers["Authorization"] = f"Bearer {tokens['access']}"
+
+    def token_refresh(self):
+        response = self.request(
+            "POST /users/token/refresh/",
+            "post",
+            "/users/token/refresh/",
+            json={"refresh": self.refresh},
+        )
+        if response is not None:
+            self.session.headers["Authorization"] = f"Bearer {response.json()['access']}"
+
+    def create_course(self):
+        response = self.request(
+            "POST /materials/",
+            "post",
+            "/materials/",
+            json={"name": f"Курс нагрузочного теста {self.email}"},
+        )
+        if response is None:
+            raise CommandError(f"Не удалось создать курс под {self.email}.")
+        self.course_id = response.json()["id"]
+        self.course_ids.append(self.course_id)
+
+    def delete_course(self):
+        if self.course_id is not None:
+            self.session.delete(f"{self.base_url}/materials/{self.course_id}/", timeout=30)
+
+    def course_list(self):
+        """Листание списка курсов по курсору: следующая страница или, после последней, снова первая."""
+        path = self.next_courses or "/materials/?pagination=cursor"
+        response = self.request("GET /materials/", "get", path)
+        if response is None:
+            self.next_courses = None
+            return
+        page = response.json()
+        self.next_courses = page["next"] and page["next"].removeprefix(self.base_url)
+        self.course_ids.extend(course["id"] for course in page["results"])
+        del self.course_ids[:-100]
+
+    def course_detail(self):
+        self.request("GET /materials/{id}/", "get", f"/materials/{self.course_id}/")
+
+    def lesson_list(self):
+        self.request("GET /materials/lessons/", "get", "/materials/lessons/")
+
+    def lesson_crud(self):
+        response = self.request(
+            "POST /materials/lessons/create/",
+            "post",
+            "/materials/lessons/create/",
+            json={"name": "Урок", "video": LESSON_VIDEO, "course": self.course_id},
+        )
+        if response is None:
+            return
+        lesson_id = response.json()["id"]
+        self.request(
+            "GET /materials/lessons/{id}/", "get", f"/materials/lessons/{lesson_id}/"
+        )
+        self.request(
+            "PATCH /materials/lessons/{id}/update/",
+            "patch",
+            f"/materials/lessons/{lesson_id}/update/",
+            json={"name": "Урок (изменен)"},
+        )
+        self.request(
+            "DELETE /materials/lessons/{id}/delete/",
+            "delete",
+            f"/materials/lessons/{lesson_id}/delete/",
+        )
+
+    def subscription_toggle(self):
+        self.request(
+            "POST /materials/subscription/",
+            "post",
+            "/materials/subscription/",
+            json={"course_id": self.rng.choice(self.course_ids)},
+        )
+
+    def payment_create(self):
+        self.request(
+            "POST /users/pay/",
+            "post",
+            "/users/pay/",
+            json={
+                "amount": self.rng.choice(PAYMENT_AMOUNTS),
+                "course": self.rng.choice(self.course_ids),
+            },
+        )
+
+    def run(self, deadline, iterations):
+        actions, weights = zip(*SCENARIO)
+        cum_weights = list(accumulate(weights))
+        self.login()
+        self.create_course()
+        done = 0
+        while (iterations is None or done < iterations) and time.monotonic() < deadline:
+            getattr(self, self.rng.choices(actions, cum_weights=cum_weights)[0])()
+            done += 1
+        return self.samples
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест API: параллельные клиенты авторизуются под пользователями, созданными командой "
+        "generate_data, и выполняют смешанный сценарий (курсы, уроки, подписки, платежи, обновление токена). "
+        "Задержки p50/p95/p99 и количество запросов в секунду по каждой конечной точке сохраняются в JSON "
+        "и могут сравниваться с предыдущим запуском. Сервер должен работать с заглушками stripe и курса валют "
+        "(STRIPE_CLIENT, EXCHANGE_RATE_SOURCE) - при --start-server он (runserver или gunicorn) запускается с ними "
+        "автоматически."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--clients", type=int, default=10)
+        parser.add_argument("--duration", type=float, default=30, help="Длительность теста в секундах")
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            help="Ограничение количества действий каждого клиента",
+        )
+        parser.add_argument(
+            "--email-pattern",
+            default="seed1-user{}@example.com",
+            help="Шаблон email пользователей, {} заменяется номером клиента",
+        )
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+        parser.add_argument(
+            "--start-server",
+            action="store_true",
+            help="Запустить сервер на адресе из --base-url с заглушками stripe и курса валют",
+        )
+        parser.add_argument(
+            "--server",
+            choices=("runserver", "gunicorn"),
+            default="runserver",
+            help="Сервер для --start-server: runserver или gunicorn с настройками config/gunicorn.conf.py",
+        )
+
+    def handle(self, *args, **options):
+        server = (
+            self.start_server(options["base_url"], options["server"])
+            if options["start_server"]
+            else None
+        )
+        try:
+            report = self.run_clients(options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        report["config"] = {
+            key: options[key]
+            for key in ("base_url", "clients", "duration", "iterations", "seed")
+        }
+        with open(options["output"], "w") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+        self.print_report(report)
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                self.print_comparison(json.load(file), report)
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {options['output']}"))
+
+    def run_clients(self, options):
+        clients = [
+            VirtualUser(
+                options["base_url"],
+                options["email_pattern"].format(number),
+                options["password"],
+                seed=options["seed"] * 1000 + number,
+            )
+            for number in range(options["clients"])
+        ]
+        started = time.monotonic()
+        deadline = started + options["duration"]
+        try:
+            with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+                futures = [
+                    executor.submit(client.run, deadline, options["iterations"])
+                    for client in clients
+                ]
+                results = [future.result() for future in futures]
+            elapsed = time.monotonic() - started
+        finally:
+            # Курсы удаляются после остановки всех клиентов: другие клиенты могли на них подписываться.
+            for client in clients:
+                client.delete_course()
+
+        samples = defaultdict(list)
+        for result in results:
+            for label, records in result.items():
+                samples[label].extend(records)
+        return summarize(samples, elapsed)
+
+    def start_server(self, base_url, kind):
+        address = base_url.split("://", 1)[-1].rstrip("/")
+        if kind == "gunicorn":
+            command = ["-m", "gunicorn", "-c", "config/gunicorn.conf.py", "--bind", address, "config.wsgi"]
+        else:
+            command = ["manage.py", "runserver", "--noreload", address]
+        server = subprocess.Popen(
+            [sys.executable, *command],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, **STUB_SERVER_ENV},
+        )
+        for _ in range(60):
+            try:
+                requests.get(base_url, timeout=1)
+                return server
+            except requests.ConnectionError:
+                time.sleep(0.5)
+        server.terminate()
+        raise CommandError(f"Сервер не запустился на {base_url}.")
+
+    def print_report(self, report):
+        self.stdout.write(f"{'Конечная точка':45} {'запросов':>9} {'ошибок':>7} {'rps':>8} "
+                          f"{'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}")
+        rows = dict(report["endpoints"])
+        if report["total"]:
+            rows["Всего"] = report["total"]
+        for label, stats in rows.items():
+            self.stdout.write(
+                f"{label:45} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>8} "
+                f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+            )
+
+    def print_comparison(self, previous, current):
+        self.stdout.write("Сравнение с предыдущим запуском (p95, rps):")
+        for label, stats in current["endpoints"].items():
+            before = previous.get("endpoints", {}).get(label)
+            if before is None:
+                continue
+            change = (
+                (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+                if before["p95_ms"]
+                else 0
+            )
+            self.stdout.write(
+                f"{label:45} p95 {before['p95_ms']} -> {stats['p95_ms']} мс ({change:+.1f}%), "
+                f"rps {before['rps']} -> {stats['rps']}"
+            )
@@ -0,0 +1,262 @@
+import heapq
+import io
+import math
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from materials.cache import courses_scope, invalidate, lessons_scope
+from materials.models import Course, Lesson, Subscription
+from users.models import Pay, User
+
+PAYMENT_STATUSES = ((Pay.PAID, 70), (Pay.UNPAID, 25), (Pay.FAILED, 5))
+PAYMENT_AMOUNTS = (990, 4900, 15000, 45000, 150000)
+
+
+def copy_rows(model, fields, rows, batch_size):
+    """
+    Запись строк в таблицу модели через COPY пачками по batch_size строк.
+    Сигналы моделей не вызываются, триггеры базы данных срабатывают. Возвращает количество строк.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ", ".join(
+        connection.ops.quote_name(model._meta.get_field(field).column) for field in fields
+    )
+    written = 0
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, batch_size)):
+            buffer = io.StringIO()
+            for row in batch:
+                buffer.write(
+                    "\t".join("\\N" if value is None else str(value) for value in row) + "\n"
+                )
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+            written += len(batch)
+    return written
+
+
+def new_ids(model, after_id):
+    """Id строк, добавленных после after_id, в порядке добавления."""
+    return list(
+        model.objects.filter(pk__gt=after_id).order_by("pk").values_list("pk", flat=True)
+    )
+
+
+def last_id(model):
+    return model.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+
+
+def popularity_weights(count, skew):
+    """Накопленные веса по закону Ципфа: вес i-го по популярности объекта 1 / (i + 1) ** skew."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерация синтетических данных для нагрузочного тестирования: пользователи, курсы, уроки, подписки "
+        "и платежи. Запись через COPY пачками, популярность курсов распределена по закону Ципфа с параметром "
+        "--skew, результат детерминирован для одного --seed на пустой базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--courses", type=int, default=100)
+        parser.add_argument("--lessons", type=int, default=1000)
+        parser.add_argument("--subscriptions", type=int, default=5000)
+        parser.add_argument("--payments", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Неравномерность популярности курсов (0 - равномерно)",
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--password",
+            default="password",
+            help="Пароль всех созданных пользователей",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["courses"] < 1:
+            raise CommandError("Нужен хотя бы один пользователь и один курс.")
+
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        started = time.monotonic()
+
+        user_ids = self.generate_users(options["users"], options["seed"], options["password"])
+        course_ids, course_owners = self.generate_courses(options["courses"], user_ids)
+        course_weights = popularity_weights(len(course_ids), options["skew"])
+        lesson_ids = self.generate_lessons(
+            options["lessons"], course_ids, course_owners, course_weights
+        )
+        subscriptions = self.generate_subscriptions(
+            options["subscriptions"], user_ids, course_ids, course_weights
+        )
+        payments = self.generate_payments(
+            options["payments"], user_ids, course_ids, course_weights, lesson_ids
+        )
+        invalidate(courses_scope(), lessons_scope())
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано пользователей: {len(user_ids)}, курсов: {len(course_ids)}, уроков: {len(lesson_ids)}, "
+                f"подписок: {subscriptions}, платежей: {payments} за {elapsed:.1f} с"
+            )
+        )
+
+    def random_moment(self):
+        """Случайный момент за последний год с точностью до микросекунды."""
+        return self.now - timedelta(microseconds=self.rng.randrange(365 * 24 * 60 * 60 * 10**6))
+
+    def generate_users(self, count, seed, password):
+        after_id = last_id(User)
+        password = make_password(password)
+        cities = ("Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", None)
+        rows = (
+            (
+                f"seed{seed}-user{number}@example.com",
+                password,
+                "",
+                "",
+                self.rng.choice(cities),
+                False,
+                False,
+                True,
+                self.now - timedelta(days=self.rng.randrange(365)),
+                self.now - timedelta(days=self.rng.randrange(60)),
+            )
+            for number in range(count)
+        )
+        copy_rows(
+            User,
+            [
+                "email",
+                "password",
+                "first_name",
+                "last_name",
+                "city",
+                "is_superuser",
+                "is_staff",
+                "is_active",
+                "date_joined",
+                "last_login",
+            ],
+            rows,
+            self.batch_size,
+        )
+        return new_ids(User, after_id)
+
+    def generate_courses(self, count, user_ids):
+        after_id = last_id(Course)
+        owners = [self.rng.choice(user_ids) for _ in range(count)]
+        rows = (
+            (f"Курс {number}", f"Описание курса {number}", owner, self.random_moment())
+            for number, owner in enumerate(owners)
+        )
+        copy_rows(Course, ["name", "description", "owner", "update_at"], rows, self.batch_size)
+        return new_ids(Course, after_id), owners
+
+    def generate_lessons(self, count, course_ids, course_owners, course_weights):
+        after_id = last_id(Lesson)
+        positions = range(len(course_ids))
+
+        def rows():
+            for number in range(count):
+                position = self.rng.choices(positions, cum_weights=course_weights)[0]
+                yield (
+                    f"Урок {number}",
+                    f"https://www.youtube.com/watch?v={number}",
+                    course_ids[position],
+                    course_owners[position],
+                    self.random_moment(),
+                )
+
+        copy_rows(Lesson, ["name", "video", "course", "owner", "update_at"], rows(), self.batch_size)
+        return new_ids(Lesson, after_id)
+
+    def generate_subscriptions(self, count, user_ids, course_ids, course_weights):
+        """
+        Подписки распределяются между пользователями равномерно, курсы выбираются по популярности.
+        Если пользователю нужно больше половины курсов, повторные выборки почти всегда попадали бы
+        в уже выбранные популярные курсы, поэтому курсы выбираются без возвращения по случайным ключам
+        с учетом весов (алгоритм Эфраимидиса - Спиракиса).
+        """
+        per_user, extra = divmod(count, len(user_ids))
+        limit = len(course_ids)
+        weights = [
+            weight - previous for previous, weight in zip([0, *course_weights], course_weights)
+        ]
+
+        def sample_without_replacement(wanted):
+            keys = (
+                (math.log(1 - self.rng.random()) / weight, course_id)
+                for weight, course_id in zip(weights, course_ids)
+            )
+            return [course_id for _, course_id in heapq.nlargest(wanted, keys)]
+
+        def rows():
+            for index, user_id in enumerate(user_ids):
+                wanted = min(per_user + (index < extra), limit)
+                if wanted * 2 > limit:
+                    chosen = sample_without_replacement(wanted)
+                else:
+                    chosen = set()
+                    while len(chosen) < wanted:
+                        chosen.update(
+                            self.rng.choices(course_ids, cum_weights=course_weights, k=wanted - len(chosen))
+                        )
+                for course_id in sorted(chosen):
+                    yield user_id, course_id
+
+        return copy_rows(Subscription, ["user", "course"], rows(), self.batch_size)
+
+    def generate_payments(self, count, user_ids, course_ids, course_weights, lesson_ids):
+        statuses, status_weights = zip(*PAYMENT_STATUSES)
+        forms = [choice for choice, _ in Pay.PAYMENT_IN_CHOICES]
+
+        def rows():
+            for number in range(count):
+                lesson_id = None
+                course_id = self.rng.choices(course_ids, cum_weights=course_weights)[0]
+                if lesson_ids and self.rng.random() < 0.2:
+                    lesson_id, course_id = self.rng.choice(lesson_ids), None
+                payment_status = self.rng.choices(statuses, weights=status_weights)[0]
+                yield (
+                    self.rng.choice(user_ids),
+                    (self.now - timedelta(days=self.rng.randrange(365))).date(),
+                    course_id,
+                    lesson_id,
+                    self.rng.choice(PAYMENT_AMOUNTS),
+                    self.rng.choice(forms),
+                    f"cs_load_{number}",
+                    payment_status,
+                )
+
+        return copy_rows(
+            Pay,
+            [
+                "user",
+                "payment_date",
+                "course",
+                "lesson",
+                "amount",
+                "form_of_payment",
+                "session_id",
+                "payment_status",
+            ],
+            rows(),
+            self.batch_size,
+        )
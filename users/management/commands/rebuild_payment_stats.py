@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from users.services import rebuild_payment_stats
+
+
+class Command(BaseCommand):
+    help = "Полный пересчет сводки платежей (статистика по дням, курсам, урокам, способам оплаты и статусам)"
+
+    def handle(self, *args, **kwargs):
+        rows = rebuild_payment_stats()
+        self.stdout.write(self.style.SUCCESS(f"Сводка платежей пересчитана, строк: {rows}"))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:45
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0005_pay_payment_status"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                fields=["is_active", "last_login"], name="users_user_active_login_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:47
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("users", "0006_user_active_login_idx"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="pay",
+            index=models.Index(fields=["session_id"], name="users_pay_session_id_idx"),
+        ),
+    ]
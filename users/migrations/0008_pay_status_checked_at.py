@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0007_pay_session_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pay",
+            name="status_checked_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Дата сверки статуса оплаты"
+            ),
+        ),
+    ]
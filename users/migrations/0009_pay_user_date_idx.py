@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("users", "0008_pay_status_checked_at"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="pay",
+            index=models.Index(
+                fields=["user", "payment_date"], name="users_pay_user_date_idx"
+            ),
+        ),
+    ]
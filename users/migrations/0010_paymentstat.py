@@ -0,0 +1,149 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+UPSERT_STAT = """
+    INSERT INTO users_paymentstat (date, course_id, lesson_id, form_of_payment, status, payments, amount)
+    VALUES (%s.payment_date, %s.course_id, %s.lesson_id, %s.form_of_payment, %s.payment_status, %s, %s)
+    ON CONFLICT ON CONSTRAINT users_paymentstat_key_uniq DO UPDATE
+    SET payments = users_paymentstat.payments + EXCLUDED.payments,
+        amount = users_paymentstat.amount + EXCLUDED.amount;
+"""
+
+CREATE_TRIGGER = f"""
+CREATE FUNCTION users_pay_update_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        {UPSERT_STAT % (("OLD",) * 5 + ("-1", "-OLD.amount"))}
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        {UPSERT_STAT % (("NEW",) * 5 + ("1", "NEW.amount"))}
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_pay_stats_insert_delete
+AFTER INSERT OR DELETE ON users_pay
+FOR EACH ROW EXECUTE FUNCTION users_pay_update_stats();
+
+CREATE TRIGGER users_pay_stats_update
+AFTER UPDATE OF payment_date, course_id, lesson_id, form_of_payment, payment_status, amount ON users_pay
+FOR EACH ROW
+WHEN (
+    (OLD.payment_date, OLD.course_id, OLD.lesson_id, OLD.form_of_payment, OLD.payment_status, OLD.amount)
+    IS DISTINCT FROM
+    (NEW.payment_date, NEW.course_id, NEW.lesson_id, NEW.form_of_payment, NEW.payment_status, NEW.amount)
+)
+EXECUTE FUNCTION users_pay_update_stats();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS users_pay_stats_update ON users_pay;
+DROP TRIGGER IF EXISTS users_pay_stats_insert_delete ON users_pay;
+DROP FUNCTION IF EXISTS users_pay_update_stats();
+"""
+
+FILL_STATS = """
+INSERT INTO users_paymentstat (date, course_id, lesson_id, form_of_payment, status, payments, amount)
+SELECT payment_date, course_id, lesson_id, form_of_payment, payment_status, COUNT(*), SUM(amount)
+FROM users_pay
+GROUP BY payment_date, course_id, lesson_id, form_of_payment, payment_status;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0010_hot_path_indexes"),
+        ("users", "0009_pay_user_date_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "form_of_payment",
+                    models.CharField(
+                        blank=True,
+                        max_length=15,
+                        null=True,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        blank=True,
+                        max_length=20,
+                        null=True,
+                        verbose_name="Статус оплаты",
+                    ),
+                ),
+                (
+                    "payments",
+                    models.IntegerField(default=0, verbose_name="Количество платежей"),
+                ),
+                (
+                    "amount",
+                    models.BigIntegerField(default=0, verbose_name="Сумма платежей"),
+                ),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="materials.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="materials.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика платежей",
+                "verbose_name_plural": "Статистика платежей",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "date",
+                            "course",
+                            "lesson",
+                            "form_of_payment",
+                            "status",
+                        ),
+                        name="users_paymentstat_key_uniq",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.RunSQL(FILL_STATS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("users", "0010_paymentstat"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                fields=["city"],
+                opclasses=["varchar_pattern_ops"],
+                name="users_user_city_prefix_idx",
+            ),
+        ),
+    ]
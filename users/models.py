@@ -42,6 +42,16 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            models.Index(
+                fields=["is_active", "last_login"], name="users_user_active_login_idx"
+            ),
+            models.Index(
+                fields=["city"],
+                opclasses=["varchar_pattern_ops"],
+                name="users_user_city_prefix_idx",
+            ),
+        ]
 
 
 class Pay(models.Model):
@@ -50,6 +60,12 @@ class Pay(models.Model):
 
     PAYMENT_IN_CHOICES = [(CASH, "Наличные"), (TRANSFER, "Перевод")]
 
+    PENDING = "pending"
+    UNPAID = "unpaid"
+    PAID = "paid"
+    FAILED = "failed"
+    EXPIRED = "expired"
+
     user = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -100,12 +116,17 @@ class Pay(models.Model):
     )
     payment_status = models.CharField(
         max_length=20,
-        default="unpaid",
+        default=UNPAID,
         verbose_name="Статус оплаты",
         help_text="Укажите статус оплаты",
         null=True,
         blank=True,
     )
+    status_checked_at = models.DateTimeField(
+        verbose_name="Дата сверки статуса оплаты",
+        null=True,
+        blank=True,
+    )
 
     def __str__(self):
         if self.course:
@@ -121,3 +142,57 @@ class Pay(models.Model):
     class Meta:
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
+        indexes = [
+            models.Index(fields=["session_id"], name="users_pay_session_id_idx"),
+            models.Index(fields=["user", "payment_date"], name="users_pay_user_date_idx"),
+        ]
+
+
+class PaymentStat(models.Model):
+    """
+    Сводка платежей по дню, курсу, уроку, способу оплаты и статусу.
+    Обновляется триггером базы данных при любом изменении таблицы платежей (в том числе через
+    update() и bulk_update()), полностью пересчитывается командой rebuild_payment_stats.
+    """
+
+    date = models.DateField(verbose_name="Дата")
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+        verbose_name="Курс",
+        null=True,
+        blank=True,
+    )
+    lesson = models.ForeignKey(
+        Lesson,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+        verbose_name="Урок",
+        null=True,
+        blank=True,
+    )
+    form_of_payment = models.CharField(
+        max_length=15, verbose_name="Способ оплаты", null=True, blank=True
+    )
+    status = models.CharField(
+        max_length=20, verbose_name="Статус оплаты", null=True, blank=True
+    )
+    payments = models.IntegerField(default=0, verbose_name="Количество платежей")
+    amount = models.BigIntegerField(default=0, verbose_name="Сумма платежей")
+
+    def __str__(self):
+        return f"{self.date}: {self.payments} платежей на сумму {self.amount}"
+
+    class Meta:
+        verbose_name = "Статистика платежей"
+        verbose_name_plural = "Статистика платежей"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "course", "lesson", "form_of_payment", "status"],
+                name="users_paymentstat_key_uniq",
+                nulls_distinct=False,
+            )
+        ]
@@ -1,5 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from rest_framework import permissions
 
+MODERATOR_GROUP = "Модератор"
+
+
+def _moderator_cache_key(user_id):
+    return f"users:{user_id}:is_moderator"
+
+
+def is_moderator(request):
+    """
+    Принадлежность пользователя к группе модераторов.
+    Берется из токена при StatelessJWTAuthentication, иначе вычисляется один раз на запрос
+    и между запросами хранится в кеше.
+    """
+    if hasattr(request, "_is_moderator"):
+        return request._is_moderator
+
+    user = request.user
+    result = getattr(user, "is_moderator_claim", False)
+    if user.is_authenticated and not hasattr(user, "is_moderator_claim"):
+        key = _moderator_cache_key(user.pk)
+        result = cache.get(key)
+        if result is None:
+            result = user.groups.filter(name=MODERATOR_GROUP).exists()
+            cache.set(key, result, timeout=settings.ROLE_CACHE_TIMEOUT)
+
+    request._is_moderator = result
+    return result
+
+
+def invalidate_roles(user_ids):
+    """
+    Сброс закешированных ролей пользователей после фиксации транзакции: иначе параллельный запрос
+    может успеть закешировать роль по еще не измененным данным.
+    """
+    keys = [_moderator_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
 
 class IsModer(permissions.BasePermission):
     """
@@ -9,15 +49,16 @@ class IsModer(permissions.BasePermission):
     message = "Такие операции может производить только модератор."
 
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="Модератор").exists()
+        return is_moderator(request)
 
 
 class IsOwner(permissions.BasePermission):
     """
-    Проверяет, является ли пользователь владельцем
+    Проверяет, является ли пользователь владельцем.
+    Поле владельца задается атрибутом owner_field представления (по умолчанию owner),
+    сравнивается по id без загрузки пользователя.
     """
 
     def has_object_permission(self, request, view, obj):
-        if obj.owner == request.user:
-            return True
-        return False
+        owner_field = getattr(view, "owner_field", "owner")
+        return getattr(obj, f"{owner_field}_id") == request.user.pk
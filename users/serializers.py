@@ -1,12 +1,75 @@
-from rest_framework.serializers import ModelSerializer
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.serializers import (CharField, DateField, IntegerField,
+                                        ModelSerializer, Serializer,
+                                        SerializerMethodField, ValidationError)
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
 
+from .authentication import add_user_claims
 from .models import Pay, User
+from .permissions import MODERATOR_GROUP
 
 
 class PaySerializer(ModelSerializer):
     class Meta:
         model = Pay
         fields = "__all__"
+        read_only_fields = ("payment_status", "session_id", "link", "status_checked_at")
+
+
+class PaymentHistorySerializer(ModelSerializer):
+    """Краткие сведения о платеже для истории платежей в профиле."""
+
+    class Meta:
+        model = Pay
+        fields = (
+            "id",
+            "payment_date",
+            "course",
+            "lesson",
+            "amount",
+            "form_of_payment",
+            "payment_status",
+        )
+
+
+def recent_payments(queryset=None):
+    """Последние платежи пользователя, от новых к старым, в пределах PROFILE_PAYMENTS_LIMIT."""
+    queryset = Pay.objects.all() if queryset is None else queryset
+    return queryset.only(*PaymentHistorySerializer.Meta.fields, "user").order_by(
+        "-payment_date", "-id"
+    )[: settings.PROFILE_PAYMENTS_LIMIT]
+
+
+class PaymentStatQuerySerializer(Serializer):
+    """Параметры запроса статистики платежей: период, фильтры и поля группировки через запятую."""
+
+    GROUP_FIELDS = ("date", "course", "lesson", "form_of_payment", "status")
+
+    date_from = DateField(required=False)
+    date_to = DateField(required=False)
+    course = IntegerField(required=False)
+    lesson = IntegerField(required=False)
+    form_of_payment = CharField(required=False)
+    status = CharField(required=False)
+    group_by = CharField(
+        required=False,
+        default="date",
+        help_text=f"Поля группировки через запятую: {', '.join(GROUP_FIELDS)}",
+    )
+
+    def validate_group_by(self, value):
+        fields = [field.strip() for field in value.split(",") if field.strip()]
+        if not fields:
+            raise ValidationError("Укажите поля группировки.")
+        unknown = set(fields) - set(self.GROUP_FIELDS)
+        if unknown:
+            raise ValidationError(f"Неизвестные поля группировки: {sorted(unknown)}.")
+        return list(dict.fromkeys(fields))
 
 
 class UserSerializer(ModelSerializer):
@@ -25,7 +88,25 @@ class UserPublicSerializer(ModelSerializer):
 
 
 class UserDetailSerializer(ModelSerializer):
-    payment = PaySerializer(many=True, source="user", read_only=True)
+    """
+    Профиль пользователя с последними платежами. Полная история доступна постранично
+    по ссылке payments_url.
+    """
+
+    payment = SerializerMethodField()
+    payments_url = SerializerMethodField()
+
+    def get_payment(self, user):
+        if hasattr(user, "recent_payments"):
+            payments = user.recent_payments
+        else:
+            payments = recent_payments(user.user.all())
+        return PaymentHistorySerializer(payments, many=True).data
+
+    def get_payments_url(self, user):
+        url = f"{reverse('users:pay-list')}?user={user.pk}&pagination=cursor"
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
 
     class Meta:
         model = User
@@ -37,4 +118,54 @@ class UserDetailSerializer(ModelSerializer):
             "city",
             "avatar",
             "payment",
+            "payments_url",
         ]
+
+
+def _is_moderator(user):
+    return user.groups.filter(name=MODERATOR_GROUP).exists()
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача токенов с утверждениями о пользователе для StatelessJWTAuthentication."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        return add_user_claims(token, user, _is_moderator(user))
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Обновление access-токена с актуальными утверждениями о пользователе.
+    Пользователь загружается одним запросом вместе с признаком модератора, access-токен создается один раз.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user = (
+            User.objects.annotate(
+                moderator=Exists(
+                    User.groups.through.objects.filter(
+                        user_id=OuterRef("pk"), group__name=MODERATOR_GROUP
+                    )
+                )
+            )
+            .filter(pk=refresh.payload.get(api_settings.USER_ID_CLAIM))
+            .first()
+        )
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+
+        data = {"access": str(add_user_claims(refresh.access_token, user, user.moderator))}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION and hasattr(refresh, "blacklist"):
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+        return data
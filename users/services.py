@@ -1,46 +1,268 @@
+import csv
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
 import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from forex_python.converter import CurrencyRates
 
 from config.settings import STRIPE_API_KEY
 
+from .models import Pay, PaymentStat
+
 stripe.api_key = STRIPE_API_KEY
 
+_local_rates = {}
+
+
+class ForexRateSource:
+    """Курсы валют из forex-python (сетевой запрос)."""
+
+    def get_rate(self, base, target):
+        return CurrencyRates().get_rate(base, target)
+
+
+class FixedRateSource:
+    """Курсы валют из таблицы EXCHANGE_RATES в настройках: для тестов и работы без сети."""
+
+    def get_rate(self, base, target):
+        return settings.EXCHANGE_RATES[base][target]
+
+
+def get_rate_source():
+    return import_string(settings.EXCHANGE_RATE_SOURCE)()
+
+
+def _rate_key(base, target):
+    return f"users:exchange_rate:{base}:{target}"
+
+
+def _last_known_rate_key(base, target):
+    return f"users:exchange_rate:{base}:{target}:last_known"
+
+
+def _remember_rate(base, target, rate):
+    _local_rates[(base, target)] = (
+        rate,
+        time.monotonic() + settings.EXCHANGE_RATE_LOCAL_TTL,
+    )
+
+
+def refresh_exchange_rate(base, target):
+    """Получение курса из источника и сохранение в кеш: актуального с TTL и последнего известного без срока."""
+
+    rate = get_rate_source().get_rate(base, target)
+    cache.set(_rate_key(base, target), rate, timeout=settings.EXCHANGE_RATE_TTL)
+    cache.set(_last_known_rate_key(base, target), rate, timeout=None)
+    _remember_rate(base, target, rate)
+    return rate
+
+
+def get_exchange_rate(base, target):
+    """
+    Курс валюты без сетевого запроса в обычном случае: из памяти процесса, затем из кеша.
+    Если курс в кеше истек, он запрашивается у источника, а при ошибке источника
+    используется последний известный курс.
+    """
+
+    local_rate = _local_rates.get((base, target))
+    if local_rate and local_rate[1] > time.monotonic():
+        return local_rate[0]
+
+    rate = cache.get(_rate_key(base, target))
+    if rate is None:
+        try:
+            return refresh_exchange_rate(base, target)
+        except Exception:
+            rate = cache.get(_last_known_rate_key(base, target))
+            if rate is None:
+                raise
+
+    _remember_rate(base, target, rate)
+    return rate
+
 
 def converter(amount):
     """Конвертирование валюты: рубли в доллары."""
 
-    c = CurrencyRates()
-    rate = c.get_rate("RUB", "USD")
+    rate = get_exchange_rate("RUB", "USD")
     return int(amount * rate)
 
 
+class StripeClient:
+    """Клиент stripe: запросы к API stripe."""
+
+    def create_price(self, amount):
+        return stripe.Price.create(
+            currency="usd",
+            unit_amount=amount * 100,
+            product_data={"name": "Pay for material"},
+        )
+
+    def create_session(self, price):
+        session = stripe.checkout.Session.create(
+            success_url="http://127.0.0.1:8000/materials/",
+            line_items=[{"price": price.id, "quantity": 1}],
+            mode="payment",
+        )
+        return session.get("id"), session.get("url")
+
+    def retrieve_session(self, session_id):
+        session = stripe.checkout.Session.retrieve(session_id)
+        return {"status": session.status, "payment_status": session.payment_status}
+
+
+class StubStripeClient:
+    """Клиент stripe без сетевых запросов: для тестов и нагрузочных прогонов."""
+
+    def create_price(self, amount):
+        return SimpleNamespace(id=f"price_stub_{amount}", unit_amount=amount * 100)
+
+    def create_session(self, price):
+        session_id = f"cs_stub_{uuid.uuid4().hex}"
+        return session_id, f"https://checkout.stripe.com/c/pay/{session_id}"
+
+    def retrieve_session(self, session_id):
+        return dict(settings.STRIPE_STUB_SESSION)
+
+
+def get_stripe_client():
+    return import_string(settings.STRIPE_CLIENT)()
+
+
+class RateLimiter:
+    """Ограничение частоты запросов (запросов в секунду), общее для нескольких потоков."""
+
+    def __init__(self, rate):
+        self._interval = 1 / rate if rate else 0
+        self._next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self._interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
 def create_stripe_price(amount):
     """Создание цены в stripe."""
 
-    return stripe.Price.create(
-        currency="usd",
-        unit_amount=amount * 100,
-        product_data={"name": "Pay for material"},
-    )
+    return get_stripe_client().create_price(amount)
 
 
 def create_stripe_sessions(price):
     """Создание сессии на оплату в stripe."""
 
-    session = stripe.checkout.Session.create(
-        success_url="http://127.0.0.1:8000/materials/",
-        line_items=[{"price": price.id, "quantity": 1}],
-        mode="payment",
+    return get_stripe_client().create_session(price)
+
+
+def create_checkout_session(amount):
+    """Создание сессии на оплату в stripe для суммы в рублях: конвертация, цена и сессия."""
+
+    amount_in_dollars = converter(amount)
+    price = create_stripe_price(amount_in_dollars)
+    return create_stripe_sessions(price)
+
+
+def payment_status_from_session(session):
+    """Статус оплаты по состоянию сессии stripe."""
+
+    if session["status"] == "expired":
+        return Pay.EXPIRED
+    return session["payment_status"]
+
+
+def parse_stripe_event(payload, signature):
+    """Проверка подписи и разбор события webhook stripe."""
+
+    return stripe.Webhook.construct_event(
+        payload, signature, settings.STRIPE_WEBHOOK_SECRET
+    )
+
+
+def payment_status_from_event(event):
+    """Статус оплаты по событию checkout.session.* или None для остальных событий."""
+
+    event_type = event["type"]
+    if event_type == "checkout.session.completed":
+        return event["data"]["object"]["payment_status"]
+    if event_type == "checkout.session.async_payment_succeeded":
+        return Pay.PAID
+    if event_type == "checkout.session.async_payment_failed":
+        return Pay.FAILED
+    if event_type == "checkout.session.expired":
+        return Pay.EXPIRED
+    return None
+
+
+def apply_session_status(session_id, payment_status):
+    """
+    Идемпотентное обновление статуса оплаты по id сессии.
+    Повторные события не меняют уже установленный статус, оплаченный платеж не понижается.
+    """
+
+    return (
+        Pay.objects.filter(session_id=session_id)
+        .exclude(payment_status__in=[payment_status, Pay.PAID])
+        .update(payment_status=payment_status, status_checked_at=timezone.now())
     )
-    return session.get("id"), session.get("url")
 
 
-def check_payment_status(session_id):
-    """Проверка статуса оплаты по ID сессии."""
+def rebuild_payment_stats():
+    """
+    Полный пересчет сводки платежей по таблице платежей.
+    На время пересчета запись в таблицу платежей блокируется, чтобы триггер сводки
+    не обновил ее параллельно. Возвращает количество строк сводки.
+    """
+    pay_table = connection.ops.quote_name(Pay._meta.db_table)
+    stat_table = connection.ops.quote_name(PaymentStat._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {pay_table} IN SHARE MODE")
+        cursor.execute(f"DELETE FROM {stat_table}")
+        cursor.execute(
+            f"""
+            INSERT INTO {stat_table} (date, course_id, lesson_id, form_of_payment, status, payments, amount)
+            SELECT payment_date, course_id, lesson_id, form_of_payment, payment_status, COUNT(*), SUM(amount)
+            FROM {pay_table}
+            GROUP BY payment_date, course_id, lesson_id, form_of_payment, payment_status
+            """
+        )
+        return cursor.rowcount
+
+
+class _Echo:
+    """Буфер для csv.writer, возвращающий записанную строку вместо ее накопления."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(fields, rows):
+    """Построчная выгрузка в CSV: заголовок, затем по строке на запись."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_ndjson(fields, rows):
+    """Построчная выгрузка в NDJSON: по JSON-объекту на строку."""
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
 
-    session = stripe.checkout.Session.retrieve(session_id)
-    return {
-        "status": session.status,
-        "payment_status": session.payment_status,
-        "user_email": session.customer_details.email,
-    }
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv; charset=utf-8"),
+    "ndjson": (iter_ndjson, "application/x-ndjson; charset=utf-8"),
+}
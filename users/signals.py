@@ -0,0 +1,26 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+from users.permissions import invalidate_roles
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс закешированных ролей при изменении состава групп пользователя."""
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        invalidate_roles([instance.pk])
+    elif action == "pre_clear":
+        invalidate_roles(instance.user_set.values_list("pk", flat=True))
+    else:
+        invalidate_roles(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, instance, **kwargs):
+    """Сброс закешированных ролей участников группы при ее переименовании или удалении."""
+    invalidate_roles(instance.user_set.values_list("pk", flat=True))
@@ -1,23 +1,140 @@
-from datetime import timedelta
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+import stripe
 from celery import shared_task
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 
-from .models import User
+from .models import Pay, User
+from .services import (RateLimiter, create_checkout_session,
+                       get_stripe_client, payment_status_from_session,
+                       refresh_exchange_rate)
 
 
 @shared_task
-def deactivate_inactive_users():
-    """Блокировка пользователей, которые не заходили более месяца"""
-    month_ago = timezone.now() - timedelta(days=30)
+def deactivate_inactive_users(batch_size=None):
+    """
+    Блокировка пользователей, которые не заходили более месяца.
+    Пользователи блокируются пачками, одним UPDATE на пачку. Заблокированные сразу выпадают из выборки,
+    поэтому прерванный запуск безопасно продолжается следующим без повторной обработки.
+    """
+    batch_size = batch_size or settings.DEACTIVATE_USERS_BATCH_SIZE
+    month_ago = timezone.now() - settings.USER_INACTIVITY_PERIOD
+    started = time.monotonic()
     count = 0
 
-    filter_login = {"last_login__lte": month_ago, "is_active": True}
-    inactive_users = User.objects.filter(**filter_login)
+    inactive_users = User.objects.filter(is_active=True, last_login__lte=month_ago)
+    while True:
+        batch = inactive_users.order_by("last_login").values("pk")[:batch_size]
+        updated = User.objects.filter(pk__in=batch).update(is_active=False)
+        count += updated
+        if updated < batch_size:
+            break
 
-    if inactive_users.exists():
-        for user in inactive_users:
-            user.update(is_active=False)
-            count += 1
+    elapsed = time.monotonic() - started
+    return f"Заблокировано {count} неактивных пользователей за {elapsed:.2f} с"
 
-    return f"Заблокировано {count} неактивных пользователей"
+
+@shared_task
+def refresh_exchange_rates():
+    """Обновление курсов валют в кеше для конвертации платежей."""
+    rates = {
+        f"{base}/{target}": refresh_exchange_rate(base, target)
+        for base, target in settings.EXCHANGE_RATE_PAIRS
+    }
+    return f"Курсы валют обновлены: {rates}"
+
+
+@shared_task(bind=True, max_retries=settings.PAYMENT_CHECKOUT_MAX_RETRIES)
+def create_payment_checkout(self, payment_id):
+    """
+    Создание сессии на оплату в stripe для платежа в статусе pending.
+    При ошибке stripe попытка повторяется с экспоненциальной задержкой, после исчерпания
+    попыток платеж переводится в статус failed.
+    """
+    payment = Pay.objects.filter(pk=payment_id, payment_status=Pay.PENDING).only("id", "amount").first()
+    if payment is None:
+        return f"Платеж {payment_id} не ожидает создания сессии"
+
+    try:
+        session_id, payment_link = create_checkout_session(payment.amount)
+    except Exception as exc:
+        if self.request.retries < self.max_retries:
+            raise self.retry(
+                exc=exc,
+                countdown=get_exponential_backoff_interval(
+                    factor=settings.PAYMENT_CHECKOUT_RETRY_BACKOFF,
+                    retries=self.request.retries,
+                    maximum=settings.PAYMENT_CHECKOUT_RETRY_BACKOFF_MAX,
+                    full_jitter=True,
+                ),
+            )
+        Pay.objects.filter(pk=payment_id, payment_status=Pay.PENDING).update(
+            payment_status=Pay.FAILED
+        )
+        return f"Не удалось создать сессию для платежа {payment_id}: {exc}"
+
+    Pay.objects.filter(pk=payment_id, payment_status=Pay.PENDING).update(
+        session_id=session_id, link=payment_link, payment_status=Pay.UNPAID
+    )
+    return f"Сессия на оплату создана для платежа {payment_id}"
+
+
+@shared_task
+def reconcile_unpaid_payments(batch_size=None):
+    """
+    Сверка статусов неоплаченных платежей со stripe.
+    Платежи выбираются пачками по id, сессии запрашиваются параллельно в ограниченном пуле потоков
+    с ограничением частоты запросов, результаты записываются одним UPDATE на каждый новый статус.
+    """
+    batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+    client = get_stripe_client()
+    limiter = RateLimiter(settings.STRIPE_RATE_LIMIT)
+    started = time.monotonic()
+    stale_before = timezone.now() - settings.PAYMENT_RECONCILE_STALE_AFTER
+
+    def fetch_session(session_id):
+        limiter.wait()
+        try:
+            return client.retrieve_session(session_id)
+        except stripe.StripeError:
+            return None
+
+    stale_payments = (
+        Pay.objects.filter(payment_status=Pay.UNPAID, session_id__isnull=False)
+        .filter(Q(status_checked_at__isnull=True) | Q(status_checked_at__lte=stale_before))
+        .order_by("pk")
+        .only("id", "session_id", "payment_status")
+    )
+    checked = updated = 0
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=settings.PAYMENT_RECONCILE_WORKERS) as executor:
+        while payments := list(stale_payments.filter(pk__gt=last_pk)[:batch_size]):
+            last_pk = payments[-1].pk
+            sessions = executor.map(fetch_session, [payment.session_id for payment in payments])
+
+            checked_ids = []
+            changed = defaultdict(list)
+            for payment, session in zip(payments, sessions):
+                if session is None:
+                    continue
+                checked_ids.append(payment.pk)
+                payment_status = payment_status_from_session(session)
+                if payment_status != payment.payment_status:
+                    changed[payment_status].append(payment.pk)
+
+            Pay.objects.filter(pk__in=checked_ids).update(status_checked_at=timezone.now())
+            for payment_status, ids in changed.items():
+                # Статус меняется, только если платеж все еще не оплачен: webhook мог обновить его
+                # после выборки пачки.
+                updated += Pay.objects.filter(pk__in=ids, payment_status=Pay.UNPAID).update(
+                    payment_status=payment_status
+                )
+            checked += len(checked_ids)
+
+    elapsed = time.monotonic() - started
+    return f"Сверено {checked} платежей, обновлено {updated} за {elapsed:.2f} с"
@@ -1,11 +1,36 @@
-from unittest.mock import patch, MagicMock
-from forex_python.converter import CurrencyRates
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import LiveServerTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from forex_python.converter import RatesNotAvailableError
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
-from materials.models import Course
-from users.models import User
+from materials.models import Course, Lesson, Subscription
+from users.authentication import StatelessJWTAuthentication
+from users.models import Pay, PaymentStat, User
+from users.permissions import is_moderator
+from users.services import (FixedRateSource, _local_rates,
+                            apply_session_status, converter, get_exchange_rate,
+                            refresh_exchange_rate)
+from users.tasks import deactivate_inactive_users, reconcile_unpaid_payments
 
 
 class UserTestCase(APITestCase):
@@ -53,6 +78,42 @@ class UserTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_token_refresh_single_query(self):
+        """Тестирование обновления токена одним запросом пользователя с признаком модератора."""
+        self.user.groups.add(Group.objects.create(name="Модератор"))
+        refresh = RefreshToken.for_user(self.user)
+
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse("users:token_refresh"), {"refresh": str(refresh)})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access = AccessToken(response.json()["access"])
+        self.assertEqual(access["email"], self.user.email)
+        self.assertTrue(access["is_moderator"])
+
+    def test_stateless_jwt_authentication(self):
+        """Тестирование аутентификации по утверждениям токена без запроса пользователя к базе."""
+        self.user.set_password("123")
+        self.user.city = "Москва"
+        self.user.save()
+        self.user.groups.add(Group.objects.create(name="Модератор"))
+        token_response = self.client.post(
+            reverse("users:token_obtain_pair"), {"email": self.user.email, "password": "123"}
+        )
+        request = RequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {token_response.json()['access']}"
+        )
+
+        with self.assertNumQueries(0):
+            user, _ = StatelessJWTAuthentication().authenticate(request)
+            request.user = user
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertEqual(user.email, self.user.email)
+            self.assertTrue(is_moderator(request))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.city, "Москва")
+
     def test_user_list(self):
         """Тестирование просмотра списка пользователей."""
         url = reverse("users:user-list")
@@ -62,16 +123,45 @@ class UserTestCase(APITestCase):
 
         self.assertEqual(
             response.json(),
-            [
-                {
-                    "email": self.user.email,
-                    "first_name": "",
-                    "city": None,
-                    "avatar": None,
-                }
-            ],
+            {
+                "next": None,
+                "previous": None,
+                "results": [
+                    {
+                        "email": self.user.email,
+                        "first_name": "",
+                        "city": None,
+                        "avatar": None,
+                    }
+                ],
+            },
+        )
+
+    def test_user_list_prefix_filter(self):
+        """Тестирование поиска пользователей по началу email и города с постраничным выводом."""
+        for number in range(6):
+            User.objects.create(email=f"student{number}@mail.ru", city="Москва")
+        User.objects.create(email="teacher@mail.ru", city="Мурманск")
+        url = reverse("users:user-list")
+
+        first_page = self.client.get(url, {"email": "student"}).json()
+        second_page = self.client.get(first_page["next"]).json()
+        city_response = self.client.get(url, {"city": "Мур"}).json()
+
+        self.assertEqual(len(first_page["results"]), 5)
+        self.assertEqual(second_page["results"][0]["email"], "student5@mail.ru")
+        self.assertIsNone(second_page["next"])
+        self.assertEqual(
+            [user["email"] for user in city_response["results"]], ["teacher@mail.ru"]
         )
 
+    def test_user_list_loads_public_columns(self):
+        """Тестирование загрузки только публичных полей пользователей."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("users:user-list"))
+
+        self.assertNotIn("password", queries[-1]["sql"])
+
     def test_user_detail(self):
         """Тестирование просмотра профиля пользователя."""
         url = reverse("users:user-detail", args=(self.user.pk,))
@@ -89,9 +179,29 @@ class UserTestCase(APITestCase):
                 "city": None,
                 "avatar": None,
                 "payment": [],
+                "payments_url": f"http://testserver/users/pay/?user={self.user.pk}&pagination=cursor",
             },
         )
 
+    @override_settings(PROFILE_PAYMENTS_LIMIT=2)
+    def test_user_detail_recent_payments(self):
+        """Тестирование вывода последних платежей в профиле за один дополнительный запрос."""
+        payments = [Pay.objects.create(user=self.user, amount=amount) for amount in (100, 200, 300)]
+        url = reverse("users:user-detail", args=(self.user.pk,))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        data = response.json()
+
+        self.assertEqual([payment["id"] for payment in data["payment"]], [payments[2].pk, payments[1].pk])
+        self.assertEqual(
+            set(data["payment"][0]),
+            {"id", "payment_date", "course", "lesson", "amount", "form_of_payment", "payment_status"},
+        )
+
+        payments_response = self.client.get(data["payments_url"])
+        self.assertEqual(len(payments_response.json()["results"]), 3)
+
     def test_another_user_detail(self):
         """Тестирование просмотра профиля пользователя другим пользователем."""
         data = {"email": "stanislav@list.ru", "password": "111111"}
@@ -134,6 +244,7 @@ class UserTestCase(APITestCase):
                 "city": "Москва",
                 "avatar": None,
                 "payment": [],
+                "payments_url": f"http://testserver/users/pay/?user={self.user.pk}&pagination=cursor",
             },
         )
 
@@ -155,11 +266,8 @@ class PayTestCase(APITestCase):
 
     @patch('users.services.stripe.Price.create')
     @patch('users.services.stripe.checkout.Session.create')
-    @patch.object(CurrencyRates, 'get_rate')
-    def test_create_payment(self, mock_get_rate, mock_session_create, mock_price_create):
+    def test_create_payment(self, mock_session_create, mock_price_create):
         """Тестирование добавления оплаты курсов."""
-        mock_get_rate.return_value = 0.014
-
         mock_price = MagicMock()
         mock_price.id = 'price_test123'
         mock_price_create.return_value = mock_price
@@ -187,7 +295,598 @@ class PayTestCase(APITestCase):
         self.assertEqual(response.json()["course"], self.course.pk)
         self.assertEqual(response.json()["lesson"], None)
 
-        mock_get_rate.assert_called_once_with("RUB", "USD")
         mock_price_create.assert_called_once()
+        self.assertEqual(
+            mock_price_create.call_args.kwargs["unit_amount"],
+            int(150000 * settings.EXCHANGE_RATES["RUB"]["USD"]) * 100,
+        )
         mock_session_create.assert_called_once()
 
+    @override_settings(STRIPE_CLIENT="users.services.StubStripeClient")
+    def test_payment_status_not_writable(self):
+        """Тестирование запрета установки статуса оплаты и данных сессии клиентом."""
+        data = {
+            "course": self.course.pk,
+            "amount": 150000,
+            "payment_status": "paid",
+            "session_id": "cs_forged",
+            "link": "https://example.com/forged",
+        }
+        response = self.client.post(reverse("users:pay-list"), data)
+        payment = Pay.objects.get(pk=response.json()["id"])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(payment.payment_status, Pay.UNPAID)
+        self.assertNotEqual(payment.session_id, "cs_forged")
+        self.assertNotEqual(payment.link, "https://example.com/forged")
+
+        url = reverse("users:pay-detail", args=(payment.pk,))
+        patch_response = self.client.patch(url, {"payment_status": "paid"})
+        payment.refresh_from_db()
+
+        self.assertEqual(patch_response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(payment.payment_status, Pay.UNPAID)
+
+    def test_payment_list_only_own_payments(self):
+        """Тестирование списка платежей: пользователь видит только свои, администратор - все."""
+        own_payment = Pay.objects.create(user=self.user, course=self.course, amount=100)
+        other_user = User.objects.create(email="other@mail.ru")
+        other_payment = Pay.objects.create(user=other_user, course=self.course, amount=200)
+        url = reverse("users:pay-list")
+
+        response = self.client.get(url, {"pagination": "cursor"})
+        filtered_response = self.client.get(
+            url, {"user": other_user.pk, "pagination": "cursor"}
+        )
+        self.client.force_authenticate(
+            user=User.objects.create(email="staff@mail.ru", is_staff=True)
+        )
+        admin_response = self.client.get(
+            url, {"user": other_user.pk, "pagination": "cursor"}
+        )
+
+        self.assertEqual(
+            [payment["id"] for payment in response.json()["results"]], [own_payment.pk]
+        )
+        self.assertEqual(filtered_response.json()["results"], [])
+        self.assertEqual(
+            [payment["id"] for payment in admin_response.json()["results"]],
+            [other_payment.pk],
+        )
+
+    def test_payment_list_cursor_ignores_ordering(self):
+        """Тестирование обхода платежей по курсору при одной дате оплаты и параметре ordering."""
+        Pay.objects.bulk_create(
+            Pay(user=self.user, course=self.course, amount=100) for _ in range(1005)
+        )
+        expected_ids = list(
+            Pay.objects.filter(user=self.user).order_by("id").values_list("id", flat=True)
+        )
+
+        seen_ids = []
+        url = reverse("users:pay-list") + "?pagination=cursor&ordering=payment_date&page_size=10"
+        while url:
+            data = self.client.get(url).json()
+            seen_ids.extend(payment["id"] for payment in data["results"])
+            url = data["next"]
+
+        self.assertEqual(seen_ids, expected_ids)
+
+    def test_retrieve_own_payment(self):
+        """Тестирование просмотра платежа его владельцем."""
+        payment = Pay.objects.create(user=self.user, course=self.course, amount=100)
+        other_user = User.objects.create(email="other@mail.ru")
+        url = reverse("users:pay-detail", args=(payment.pk,))
+
+        response = self.client.get(url)
+        self.client.force_authenticate(user=other_user)
+        other_response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(other_response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @patch('users.services.stripe.Price.create')
+    @patch('users.services.stripe.checkout.Session.create')
+    def test_create_payment_async(self, mock_session_create, mock_price_create):
+        """Тестирование асинхронного создания сессии на оплату."""
+        mock_price_create.return_value = MagicMock(id='price_test123')
+        mock_session_create.return_value = {
+            'id': 'sess_test123',
+            'url': 'https://checkout.stripe.com/pay/test'
+        }
+
+        data = {"course": self.course.pk, "amount": 150000, "form_of_payment": "Наличные"}
+        url = reverse("users:pay-list")
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(f"{url}?checkout=async", data)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()["payment_status"], "pending")
+        self.assertIsNone(response.json()["link"])
+        mock_session_create.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        status_response = self.client.get(response.json()["status_url"])
+
+        self.assertEqual(
+            status_response.json(),
+            {
+                "payment_id": response.json()["id"],
+                "status": "unpaid",
+                "link": "https://checkout.stripe.com/pay/test",
+            },
+        )
+
+    def test_payment_checkout_only_for_owner(self):
+        """Тестирование запрета просмотра сессии и статуса оплаты другим пользователем."""
+        payment = Pay.objects.create(
+            user=self.user,
+            amount=150000,
+            session_id="cs_test123",
+            link="https://checkout.stripe.com/pay/test",
+        )
+        other_user = User.objects.create(email="other@mail.ru")
+        self.client.force_authenticate(user=other_user)
+
+        checkout_response = self.client.get(reverse("users:pay-checkout", args=(payment.pk,)))
+        status_response = self.client.get(reverse("users:pay-check-status", args=(payment.pk,)))
+
+        self.assertEqual(checkout_response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(status_response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertNotIn("link", checkout_response.json())
+
+
+class PaymentExportTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@mail.ru", is_staff=True)
+        self.user = User.objects.create(email="user@mail.ru")
+        self.course = Course.objects.create(name="Python-разработка")
+        self.payments = [
+            Pay.objects.create(user=self.user, course=self.course, amount=1000),
+            Pay.objects.create(user=self.user, amount=2000, form_of_payment=Pay.CASH),
+            Pay.objects.create(user=self.admin, course=self.course, amount=3000),
+        ]
+        self.client.force_authenticate(user=self.admin)
+
+    def test_export_csv_with_filters(self):
+        """Тестирование потоковой выгрузки платежей в CSV с фильтрацией и сортировкой списка."""
+        url = reverse("users:pay-export")
+        response = self.client.get(
+            url, {"course": self.course.pk, "ordering": "-payment_date"}
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        self.assertTrue(lines[0].startswith("id,user_id,payment_date"))
+        self.assertEqual(
+            [line.split(",")[0] for line in lines[1:]],
+            [str(self.payments[0].pk), str(self.payments[2].pk)],
+        )
+
+    def test_export_ndjson(self):
+        """Тестирование потоковой выгрузки платежей в NDJSON."""
+        url = reverse("users:pay-export")
+        response = self.client.get(url, {"file_format": "ndjson"})
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+
+        self.assertEqual([row["amount"] for row in rows], [1000, 2000, 3000])
+        self.assertEqual(rows[1]["form_of_payment"], Pay.CASH)
+        self.assertIsNone(rows[1]["course_id"])
+
+    def test_export_permissions_and_format(self):
+        """Тестирование доступа к выгрузке только для администратора и проверки формата."""
+        url = reverse("users:pay-export")
+        invalid_response = self.client.get(url, {"file_format": "xlsx"})
+        self.client.force_authenticate(user=self.user)
+        user_response = self.client.get(url)
+
+        self.assertEqual(invalid_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(user_response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentStatTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="admin@mail.ru", is_staff=True)
+        self.course = Course.objects.create(name="Python-разработка")
+        self.paid = Pay.objects.create(
+            user=self.admin, course=self.course, amount=1000, session_id="cs_paid"
+        )
+        self.unpaid = Pay.objects.create(user=self.admin, course=self.course, amount=2000)
+        self.cash = Pay.objects.create(
+            user=self.admin, amount=500, form_of_payment=Pay.CASH
+        )
+        apply_session_status("cs_paid", Pay.PAID)
+        self.client.force_authenticate(user=self.admin)
+
+    def get_stats(self, **params):
+        return self.client.get(reverse("users:pay-stats"), params).json()
+
+    def stat_rows(self):
+        return sorted(
+            PaymentStat.objects.filter(payments__gt=0).values_list(
+                "date", "course", "lesson", "form_of_payment", "status", "payments", "amount"
+            ),
+            key=str,
+        )
+
+    def test_stats_follow_payment_changes(self):
+        """Тестирование обновления сводки при создании, изменении статуса и удалении платежей."""
+        data = self.get_stats(group_by="course,status")
+
+        self.assertEqual(data["totals"], {"payments": 3, "amount": 3500})
+        self.assertEqual(
+            data["results"],
+            [
+                {"course": self.course.pk, "status": Pay.PAID, "payments": 1, "amount": 1000},
+                {"course": self.course.pk, "status": Pay.UNPAID, "payments": 1, "amount": 2000},
+                {"course": None, "status": Pay.UNPAID, "payments": 1, "amount": 500},
+            ],
+        )
+
+        self.unpaid.payment_status = Pay.PAID
+        self.unpaid.save()
+        self.cash.delete()
+        data = self.get_stats(status=Pay.PAID)
+
+        self.assertEqual(data["totals"], {"payments": 2, "amount": 3000})
+        self.assertEqual(
+            data["results"],
+            [{"date": str(self.paid.payment_date), "payments": 2, "amount": 3000}],
+        )
+        self.assertEqual(self.get_stats(status=Pay.UNPAID)["results"], [])
+
+    def test_rebuild_payment_stats(self):
+        """Тестирование совпадения пересчитанной сводки с обновляемой инкрементально."""
+        incremental = self.stat_rows()
+        PaymentStat.objects.all().delete()
+
+        call_command("rebuild_payment_stats", stdout=StringIO())
+
+        self.assertEqual(self.stat_rows(), incremental)
+
+    def test_stats_permissions_and_params(self):
+        """Тестирование доступа к статистике только для администратора и проверки группировки."""
+        url = reverse("users:pay-stats")
+        invalid_response = self.client.get(url, {"group_by": "user"})
+        self.client.force_authenticate(user=User.objects.create(email="user@mail.ru"))
+        user_response = self.client.get(url)
+
+        self.assertEqual(invalid_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(user_response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="admin@mail.ru")
+        self.payment = Pay.objects.create(
+            user=self.user, amount=150000, session_id="cs_test123"
+        )
+        self.url = reverse("users:stripe-webhook")
+
+    def post_event(self, event_type, payment_status="paid", secret="whsec_test"):
+        payload = json.dumps(
+            {
+                "id": "evt_test",
+                "object": "event",
+                "type": event_type,
+                "data": {
+                    "object": {
+                        "id": "cs_test123",
+                        "object": "checkout.session",
+                        "payment_status": payment_status,
+                    }
+                },
+            }
+        )
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            self.url,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_completed_event_marks_payment_paid(self):
+        """Тестирование идемпотентного обновления статуса оплаты по событию stripe."""
+        response = self.post_event("checkout.session.completed")
+        repeated_response = self.post_event("checkout.session.completed")
+        self.payment.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["updated"], 1)
+        self.assertEqual(repeated_response.json()["updated"], 0)
+        self.assertEqual(self.payment.payment_status, "paid")
+
+        self.post_event("checkout.session.expired")
+        self.payment.refresh_from_db()
+
+        self.assertEqual(self.payment.payment_status, "paid")
+
+    def test_invalid_signature(self):
+        """Тестирование отклонения события с неверной подписью."""
+        response = self.post_event("checkout.session.completed", secret="whsec_wrong")
+        self.payment.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.payment.payment_status, "unpaid")
+
+    @override_settings(STRIPE_WEBHOOK_SECRET=None)
+    def test_webhook_without_secret(self):
+        """Тестирование отказа в приеме событий без настроенного секрета webhook."""
+        response = self.post_event("checkout.session.completed")
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.payment_status, "unpaid")
+
+    def test_check_status_without_stripe_request(self):
+        """Тестирование проверки статуса оплаты без обращения к stripe."""
+        self.post_event("checkout.session.completed")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("users:pay-check-status", args=(self.payment.pk,))
+
+        with patch("users.services.stripe.checkout.Session.retrieve") as mock_retrieve:
+            response = self.client.get(url)
+
+        self.assertEqual(response.json()["status"], "paid")
+        mock_retrieve.assert_not_called()
+
+
+@override_settings(STRIPE_CLIENT="users.services.StubStripeClient", STRIPE_RATE_LIMIT=0)
+class ReconcileUnpaidPaymentsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="admin@mail.ru")
+        self.stale = [
+            Pay.objects.create(user=self.user, amount=100, session_id=f"cs_test{number}")
+            for number in range(3)
+        ]
+        self.recently_checked = Pay.objects.create(
+            user=self.user,
+            amount=100,
+            session_id="cs_recent",
+            status_checked_at=timezone.now(),
+        )
+        self.without_session = Pay.objects.create(user=self.user, amount=100)
+
+    def test_reconcile_unpaid_payments(self):
+        """Тестирование сверки статусов неоплаченных платежей пачками."""
+        result = reconcile_unpaid_payments(batch_size=2)
+
+        self.assertTrue(result.startswith("Сверено 3 платежей, обновлено 3"))
+        self.assertEqual(
+            Pay.objects.filter(payment_status="paid").count(), len(self.stale)
+        )
+        self.assertEqual(
+            Pay.objects.get(pk=self.recently_checked.pk).payment_status, "unpaid"
+        )
+        self.assertEqual(
+            Pay.objects.get(pk=self.without_session.pk).payment_status, "unpaid"
+        )
+
+    @override_settings(STRIPE_STUB_SESSION={"status": "expired", "payment_status": "unpaid"})
+    def test_reconcile_expired_sessions(self):
+        """Тестирование перевода платежей с истекшей сессией в статус expired."""
+        reconcile_unpaid_payments()
+
+        self.assertEqual(Pay.objects.filter(payment_status="expired").count(), 3)
+        self.assertFalse(
+            Pay.objects.filter(pk__in=[payment.pk for payment in self.stale])
+            .filter(status_checked_at__isnull=True)
+            .exists()
+        )
+
+    def test_reconcile_does_not_downgrade_paid_payment(self):
+        """Тестирование сверки: платеж, оплаченный через webhook во время сверки, не понижается."""
+        paid_during_reconcile = self.stale[0]
+
+        def webhook_then_expired(session):
+            apply_session_status(paid_during_reconcile.session_id, Pay.PAID)
+            return Pay.EXPIRED
+
+        with patch("users.tasks.payment_status_from_session", side_effect=webhook_then_expired):
+            result = reconcile_unpaid_payments()
+
+        self.assertTrue(result.startswith("Сверено 3 платежей, обновлено 2"))
+        self.assertEqual(
+            Pay.objects.get(pk=paid_during_reconcile.pk).payment_status, Pay.PAID
+        )
+        self.assertEqual(Pay.objects.filter(payment_status=Pay.EXPIRED).count(), 2)
+
+
+@override_settings(EXCHANGE_RATES={"EUR": {"USD": 1.1}})
+class ExchangeRateTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        _local_rates.clear()
+
+    def test_rate_served_from_cache(self):
+        """Тестирование получения курса без обращения к источнику после обновления."""
+        refresh_exchange_rate("EUR", "USD")
+        _local_rates.clear()
+
+        with patch.object(FixedRateSource, "get_rate") as mock_get_rate:
+            rate = get_exchange_rate("EUR", "USD")
+
+        self.assertEqual(rate, 1.1)
+        mock_get_rate.assert_not_called()
+
+    def test_last_known_rate_fallback(self):
+        """Тестирование использования последнего известного курса при недоступности источника."""
+        refresh_exchange_rate("EUR", "USD")
+        cache.delete("users:exchange_rate:EUR:USD")
+        _local_rates.clear()
+
+        with patch.object(
+            FixedRateSource, "get_rate", side_effect=RatesNotAvailableError("offline")
+        ):
+            rate = get_exchange_rate("EUR", "USD")
+
+        self.assertEqual(rate, 1.1)
+
+    def test_converter_without_rates(self):
+        """Тестирование ошибки конвертации, если курс ни разу не был получен."""
+        with patch.object(
+            FixedRateSource, "get_rate", side_effect=RatesNotAvailableError("offline")
+        ):
+            with self.assertRaises(RatesNotAvailableError):
+                converter(100)
+
+
+class DeactivateInactiveUsersTestCase(APITestCase):
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=40)
+        for number in range(5):
+            User.objects.create(email=f"inactive{number}@mail.ru", last_login=long_ago)
+        self.active_user = User.objects.create(email="active@mail.ru", last_login=timezone.now())
+        self.new_user = User.objects.create(email="new@mail.ru")
+
+    def test_deactivate_inactive_users_in_batches(self):
+        """Тестирование блокировки неактивных пользователей пачками."""
+        with CaptureQueriesContext(connection) as queries:
+            result = deactivate_inactive_users(batch_size=2)
+
+        updates = [query for query in queries if query["sql"].startswith("UPDATE")]
+
+        self.assertTrue(result.startswith("Заблокировано 5 неактивных пользователей"))
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 5)
+        self.assertTrue(User.objects.get(pk=self.active_user.pk).is_active)
+        self.assertTrue(User.objects.get(pk=self.new_user.pk).is_active)
+
+        self.assertTrue(deactivate_inactive_users().startswith("Заблокировано 0"))
+
+
+class GenerateDataTestCase(APITestCase):
+
+    def generate(self, seed=7):
+        call_command(
+            "generate_data",
+            users=30,
+            courses=10,
+            lessons=50,
+            subscriptions=90,
+            payments=60,
+            seed=seed,
+            skew=1.5,
+            batch_size=16,
+            stdout=StringIO(),
+        )
+
+    def test_generate_data(self):
+        """Тестирование генерации синтетических данных с неравномерной популярностью курсов."""
+        self.generate()
+
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Course.objects.count(), 10)
+        self.assertEqual(Lesson.objects.count(), 50)
+        self.assertEqual(Subscription.objects.count(), 90)
+        self.assertEqual(Pay.objects.count(), 60)
+        self.assertEqual(
+            PaymentStat.objects.aggregate(total=Sum("payments"))["total"], 60
+        )
+
+        popularity = list(
+            Course.objects.annotate(subscribers=Count("subscription"))
+            .order_by("-subscribers")
+            .values_list("subscribers", flat=True)
+        )
+        self.assertGreater(popularity[0], popularity[-1])
+        self.assertEqual(Course.objects.values("update_at").distinct().count(), 10)
+        self.assertGreater(Lesson.objects.values("update_at").distinct().count(), 45)
+
+    def test_generate_dense_subscriptions(self):
+        """Тестирование генерации подписок почти на все курсы при сильной неравномерности популярности."""
+        call_command(
+            "generate_data",
+            users=3,
+            courses=40,
+            lessons=0,
+            subscriptions=117,
+            payments=0,
+            seed=7,
+            skew=3,
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(Subscription.objects.count(), 117)
+        self.assertEqual(
+            Subscription.objects.values("user", "course").distinct().count(), 117
+        )
+
+    def test_generate_data_is_deterministic(self):
+        """Тестирование воспроизводимости генерации при одинаковом seed."""
+        self.generate()
+        first = list(Subscription.objects.order_by("id").values_list("user__email", "course__name"))
+        Subscription.objects.all().delete()
+        Pay.objects.all().delete()
+        Lesson.objects.all().delete()
+        Course.objects.all().delete()
+        User.objects.all().delete()
+
+        self.generate()
+        second = list(Subscription.objects.order_by("id").values_list("user__email", "course__name"))
+        self.assertEqual(first, second)
+
+
+@override_settings(STRIPE_CLIENT="users.services.StubStripeClient")
+class BenchmarkApiTestCase(LiveServerTestCase):
+
+    def setUp(self):
+        for number in range(2):
+            user = User.objects.create(email=f"bench{number}@example.com")
+            user.set_password("password")
+            user.save()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, "benchmark.json")
+
+    def benchmark(self, **options):
+        call_command(
+            "benchmark_api",
+            base_url=self.live_server_url,
+            clients=2,
+            iterations=15,
+            email_pattern="bench{}@example.com",
+            output=self.output,
+            stdout=StringIO(),
+            **options,
+        )
+        with open(self.output) as file:
+            return json.load(file)
+
+    def test_benchmark_api(self):
+        """Тестирование нагрузочного теста API: отчет по конечным точкам без ошибок."""
+        report = self.benchmark()
+
+        self.assertEqual(report["endpoints"]["POST /users/token/"]["requests"], 2)
+        self.assertEqual(report["endpoints"]["POST /materials/"]["requests"], 2)
+        self.assertEqual(report["total"]["errors"], 0)
+        for stats in report["endpoints"].values():
+            self.assertLessEqual(stats["p50_ms"], stats["p95_ms"])
+            self.assertLessEqual(stats["p95_ms"], stats["p99_ms"])
+        self.assertFalse(Course.objects.exists())
+
+        previous = os.path.join(os.path.dirname(self.output), "previous.json")
+        os.rename(self.output, previous)
+        out = StringIO()
+        call_command(
+            "benchmark_api",
+            base_url=self.live_server_url,
+            clients=1,
+            iterations=5,
+            email_pattern="bench{}@example.com",
+            output=self.output,
+            compare=previous,
+            stdout=out,
+        )
+        self.assertIn("POST /users/token/ ", out.getvalue())
+        self.assertIn("Сравнение с предыдущим запуском", out.getvalue())
@@ -8,8 +8,9 @@ from rest_framework_simplejwt.views import (TokenObtainPairView,
 
 from users.apps import UsersConfig
 
-from .views import (PayViewSet, UserCreateAPIView, UserDestroyAPIView,
-                    UserListAPIView, UserRetrieveAPIView, UserUpdateAPIView)
+from .views import (PayViewSet, StripeWebhookAPIView, UserCreateAPIView,
+                    UserDestroyAPIView, UserListAPIView, UserRetrieveAPIView,
+                    UserUpdateAPIView)
 
 app_name = UsersConfig.name
 
@@ -40,6 +41,7 @@ urlpatterns = [
     path("<int:pk>/", UserRetrieveAPIView.as_view(), name="user-detail"),
     path("<int:pk>/update/", UserUpdateAPIView.as_view(), name="user-update"),
     path("<int:pk>/delete/", UserDestroyAPIView.as_view(), name="user-delete"),
+    path("pay/webhook/", StripeWebhookAPIView.as_view(), name="stripe-webhook"),
     path(
         "token/",
         TokenObtainPairView.as_view(permission_classes=(AllowAny,)),
@@ -1,8 +1,14 @@
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import filters
+from rest_framework import filters, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
@@ -10,14 +16,21 @@ from rest_framework.generics import (CreateAPIView, DestroyAPIView,
                                      UpdateAPIView)
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from .models import Pay, User
+from materials.paginators import CursorPaginationMixin, CustomCursorPaginator
+
+from .filters import UserFilter
+from .models import Pay, PaymentStat, User
 from .permissions import IsOwner
-from .serializers import (PaySerializer, UserDetailSerializer,
-                          UserPublicSerializer, UserSerializer)
-from .services import (check_payment_status, converter, create_stripe_price,
-                       create_stripe_sessions)
+from .serializers import (PaymentStatQuerySerializer, PaySerializer,
+                          UserDetailSerializer, UserPublicSerializer,
+                          UserSerializer, recent_payments)
+from .services import (EXPORT_FORMATS, apply_session_status,
+                       create_checkout_session, parse_stripe_event,
+                       payment_status_from_event)
+from .tasks import create_payment_checkout
 
 
 @method_decorator(
@@ -31,6 +44,7 @@ class UserCreateAPIView(CreateAPIView):
     serializer_class = UserSerializer
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
+    query_budget = 7
 
     def perform_create(self, serializer):
         user = serializer.save(is_active=True)
@@ -43,21 +57,53 @@ class UserCreateAPIView(CreateAPIView):
     decorator=swagger_auto_schema(
         operation_summary="Список пользователей",
         operation_description="Вывод списка авторизованных пользователей. Требуется авторизация. "
-        "Для просмотра доступны поля: email, имя, город, аватар.",
+        "Для просмотра доступны поля: email, имя, город, аватар. Реализована пагинация по курсору "
+        "(порядок по id), по 5 объектов на странице, максимально - 10. Параметры email и city "
+        "фильтруют по началу значения (с учетом регистра).",
         responses={200: UserPublicSerializer(many=True)},
     ),
 )
 class UserListAPIView(ListAPIView):
-    queryset = User.objects.all()
+    serializer_class = UserPublicSerializer
+    pagination_class = CustomCursorPaginator
+    filterset_class = UserFilter
+    query_budget = 2
+
+    def get_queryset(self):
+        """Загружаются только выводимые поля, без хеша пароля и прочих данных профиля."""
+        return User.objects.only("id", *UserPublicSerializer.Meta.fields).order_by("id")
 
     def get_serializer_class(self):
         user = self.request.user
 
         if user.is_authenticated:
-            return UserPublicSerializer
+            return super().get_serializer_class()
         raise PermissionDenied
 
 
+class UserProfileMixin:
+    """
+    Права на профиль определяются по id из URL, поэтому профиль загружается один раз за запрос.
+    Для владельца профиля и администратора последние платежи подгружаются одним дополнительным запросом.
+    """
+
+    def is_owner_or_admin(self):
+        user = self.request.user
+        return (
+            user.is_staff
+            or user.is_superuser
+            or str(user.pk) == str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_owner_or_admin():
+            queryset = queryset.prefetch_related(
+                Prefetch("user", queryset=recent_payments(), to_attr="recent_payments")
+            )
+        return queryset
+
+
 @method_decorator(
     name="get",
     decorator=swagger_auto_schema(
@@ -84,14 +130,12 @@ class UserListAPIView(ListAPIView):
         },
     ),
 )
-class UserRetrieveAPIView(RetrieveAPIView):
+class UserRetrieveAPIView(UserProfileMixin, RetrieveAPIView):
     queryset = User.objects.all()
+    query_budget = 3
 
     def get_serializer_class(self):
-        user = self.request.user
-        requested_user = self.get_object()
-
-        if user.is_staff or user.is_superuser or user.id == requested_user.id:
+        if self.is_owner_or_admin():
             return UserDetailSerializer
         return UserPublicSerializer
 
@@ -116,14 +160,12 @@ class UserRetrieveAPIView(RetrieveAPIView):
         responses={200: UserDetailSerializer(many=True)},
     ),
 )
-class UserUpdateAPIView(UpdateAPIView):
+class UserUpdateAPIView(UserProfileMixin, UpdateAPIView):
     queryset = User.objects.all()
+    query_budget = 4
 
     def get_serializer_class(self):
-        user = self.request.user
-        requested_user = self.get_object()
-
-        if user.is_staff or user.is_superuser or user.id == requested_user.id:
+        if self.is_owner_or_admin():
             return UserDetailSerializer
         raise PermissionDenied
 
@@ -137,21 +179,34 @@ class UserUpdateAPIView(UpdateAPIView):
 )
 class UserDestroyAPIView(DestroyAPIView):
     queryset = User.objects.all()
+    query_budget = 10
 
 
 @method_decorator(
     name="list",
     decorator=swagger_auto_schema(
         operation_summary="Список платежей",
-        operation_description="Получение списка всех платежей пользователя. Реализована фильтрация по урокам, курсам, "
-        "способам оплаты. Доступно для владельцев профиля и администратора.",
+        operation_description="Получение списка платежей. Пользователь видит только свои платежи, администратор - "
+        "платежи всех пользователей. Реализована фильтрация по пользователю, урокам, курсам, способам оплаты. "
+        "С параметром pagination=cursor используется пагинация по курсору (порядок по id, параметр ordering "
+        "не учитывается).",
     ),
 )
 @method_decorator(
     name="create",
     decorator=swagger_auto_schema(
         operation_summary="Создание платежа",
-        operation_description="Создание нового платежа за курс или отдельный урок.",
+        operation_description="Создание нового платежа за курс или отдельный урок. С параметром checkout=async "
+        "платеж создается сразу в статусе pending, сессия stripe создается в фоне, ответ 202 содержит "
+        "status_url для проверки готовности ссылки на оплату.",
+        manual_parameters=[
+            openapi.Parameter(
+                "checkout",
+                openapi.IN_QUERY,
+                description="async - асинхронное создание сессии на оплату",
+                type=openapi.TYPE_STRING,
+            )
+        ],
     ),
 )
 @method_decorator(
@@ -183,11 +238,75 @@ class UserDestroyAPIView(DestroyAPIView):
         operation_description="Удаление платежа из базы данных. Требуются права администратора.",
     ),
 )
+@method_decorator(
+    name="checkout",
+    decorator=swagger_auto_schema(
+        operation_summary="Готовность ссылки на оплату",
+        operation_description="Статус асинхронного создания сессии на оплату: pending - сессия создается, "
+        "unpaid - ссылка на оплату готова, failed - сессию создать не удалось.",
+        responses={
+            200: openapi.Response(
+                description="Статус создания сессии",
+                examples={
+                    "application/json": {
+                        "payment_id": 1,
+                        "status": "unpaid",
+                        "link": "https://checkout.stripe.com/pay/cs_test",
+                    }
+                },
+            ),
+        },
+    ),
+)
+@method_decorator(
+    name="export",
+    decorator=swagger_auto_schema(
+        operation_summary="Выгрузка платежей",
+        operation_description="Потоковая выгрузка всех платежей без пагинации с теми же фильтрами и сортировкой, "
+        "что и у списка. Записи читаются из базы порциями через серверный курсор. Доступно только "
+        "администратору.",
+        manual_parameters=[
+            openapi.Parameter(
+                "file_format",
+                openapi.IN_QUERY,
+                description="Формат выгрузки: csv (по умолчанию) или ndjson",
+                type=openapi.TYPE_STRING,
+                enum=list(EXPORT_FORMATS),
+            )
+        ],
+        responses={200: "Файл выгрузки", 400: "Неизвестный формат выгрузки."},
+    ),
+)
+@method_decorator(
+    name="stats",
+    decorator=swagger_auto_schema(
+        operation_summary="Статистика платежей",
+        operation_description="Количество и сумма платежей по дням, курсам, урокам, способам оплаты и статусам "
+        "из предварительно агрегированной сводки. Поля группировки задаются параметром group_by, "
+        "по умолчанию группировка по дням. Доступно только администратору.",
+        query_serializer=PaymentStatQuerySerializer,
+        responses={
+            200: openapi.Response(
+                description="Статистика платежей",
+                examples={
+                    "application/json": {
+                        "group_by": ["date"],
+                        "totals": {"payments": 3, "amount": 450000},
+                        "results": [
+                            {"date": "2024-07-28", "payments": 3, "amount": 450000}
+                        ],
+                    }
+                },
+            ),
+        },
+    ),
+)
 @method_decorator(
     name="check_status",
     decorator=swagger_auto_schema(
         operation_summary="Проверка статуса оплаты",
-        operation_description="Проверяет текущий статус платежа в системе stripe.",
+        operation_description="Возвращает текущий статус платежа. Статус обновляется webhook-событиями stripe, "
+        "запрос к stripe не выполняется.",
         responses={
             200: openapi.Response(
                 description="Статус платежа",
@@ -196,9 +315,8 @@ class UserDestroyAPIView(DestroyAPIView):
                         "payment_id": 1,
                         "status": "paid",
                         "details": {
-                            "status": "complete",
-                            "payment_status": "paid",
-                            "user_email": "user@example.com",
+                            "session_id": "cs_test",
+                            "link": "https://checkout.stripe.com/pay/cs_test",
                             "payment_method": "Перевод",
                         },
                     }
@@ -208,28 +326,126 @@ class UserDestroyAPIView(DestroyAPIView):
         },
     ),
 )
-class PayViewSet(ModelViewSet):
+class PayViewSet(CursorPaginationMixin, ModelViewSet):
     queryset = Pay.objects.all()
     serializer_class = PaySerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ("lesson", "course", "form_of_payment")
+    filterset_fields = ("user", "lesson", "course", "form_of_payment")
     ordering_fields = ("payment_date",)
+    owner_field = "user"
+    query_budget = {
+        "list": 3,
+        "create": 4,
+        "retrieve": 2,
+        "update": 3,
+        "partial_update": 3,
+        "destroy": 3,
+        "checkout": 2,
+        "check_status": 2,
+        "export": 2,
+        "stats": 3,
+    }
+
+    def get_queryset(self):
+        """Без прав администратора в списке только платежи самого пользователя."""
+        queryset = super().get_queryset()
+        if self.action == "list" and not self.request.user.is_staff:
+            queryset = queryset.filter(user_id=self.request.user.pk)
+        return queryset
 
     def get_permissions(self):
-        if self.action in ["create", "retrieve"]:
+        if self.action in ["create", "retrieve", "checkout", "check_status"]:
             self.permission_classes = (IsOwner | IsAdminUser,)
-        elif self.action in ["update", "destroy"]:
+        elif self.action in ["update", "partial_update", "destroy", "export", "stats"]:
             self.permission_classes = (IsAdminUser,)
         return super().get_permissions()
 
+    def create(self, request, *args, **kwargs):
+        if request.query_params.get("checkout") != "async":
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payment = serializer.save(user=request.user, payment_status=Pay.PENDING)
+        transaction.on_commit(lambda: create_payment_checkout.delay(payment.pk))
+
+        status_url = request.build_absolute_uri(
+            reverse("users:pay-checkout", args=(payment.pk,))
+        )
+        return Response(
+            {**serializer.data, "status_url": status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url},
+        )
+
     def perform_create(self, serializer):
-        payment = serializer.save(user=self.request.user)
-        amount_in_dollars = converter(payment.amount)
-        price = create_stripe_price(amount_in_dollars)
-        session_id, payment_link = create_stripe_sessions(price)
-        payment.session_id = session_id
-        payment.link = payment_link
-        payment.save()
+        session_id, payment_link = create_checkout_session(
+            serializer.validated_data["amount"]
+        )
+        serializer.save(user=self.request.user, session_id=session_id, link=payment_link)
+
+    @action(detail=True, methods=["get"])
+    def checkout(self, request, pk=None):
+        """Статус асинхронного создания сессии на оплату."""
+        payment = self.get_object()
+        return Response(
+            {
+                "payment_id": payment.id,
+                "status": payment.payment_status,
+                "link": payment.link,
+            }
+        )
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Потоковая выгрузка платежей в CSV или NDJSON."""
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": "Неизвестный формат выгрузки."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fields = [field.attname for field in Pay._meta.concrete_fields]
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = (
+            queryset.order_by(*queryset.query.order_by, "id")
+            .values_list(*fields)
+            .iterator(chunk_size=settings.PAYMENT_EXPORT_CHUNK_SIZE)
+        )
+        serialize, content_type = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            serialize(fields, rows), content_type=content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="payments.{file_format}"'
+        return response
+
+    @action(detail=False, methods=["get"])
+    def stats(self, request):
+        """Статистика платежей из сводной таблицы."""
+        query = PaymentStatQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = dict(query.validated_data)
+        group_by = params.pop("group_by")
+
+        lookups = {"date_from": "date__gte", "date_to": "date__lte"}
+        stats = PaymentStat.objects.filter(
+            **{lookups.get(name, name): value for name, value in params.items()}
+        )
+        totals = stats.aggregate(payments=Sum("payments"), amount=Sum("amount"))
+        results = (
+            stats.values(*group_by)
+            .annotate(payments=Sum("payments"), amount=Sum("amount"))
+            .filter(payments__gt=0)
+            .order_by(*group_by)
+        )
+        return Response(
+            {
+                "group_by": group_by,
+                "totals": {name: value or 0 for name, value in totals.items()},
+                "results": list(results),
+            }
+        )
 
     @action(detail=True, methods=["get"])
     def check_status(self, request, pk=None):
@@ -238,16 +454,54 @@ class PayViewSet(ModelViewSet):
         if not payment.session_id:
             return Response({"error": "Неверный ID платежа."}, status=400)
 
-        status_info = check_payment_status(payment.session_id)
-        payment.payment_status = status_info.get(
-            "payment_status", payment.payment_status
-        )
-        payment.save()
-
         return Response(
             {
                 "payment_id": payment.id,
                 "status": payment.payment_status,
-                "details": status_info,
+                "details": {
+                    "session_id": payment.session_id,
+                    "link": payment.link,
+                    "payment_method": payment.form_of_payment,
+                },
             }
         )
+
+
+@method_decorator(
+    name="post",
+    decorator=swagger_auto_schema(
+        operation_summary="Webhook stripe",
+        operation_description="Прием событий checkout.session.* от stripe. Подпись проверяется по заголовку "
+        "Stripe-Signature, статус оплаты обновляется идемпотентно по id сессии. Без настроенного "
+        "STRIPE_WEBHOOK_SECRET события не принимаются (ответ 503).",
+    ),
+)
+class StripeWebhookAPIView(APIView):
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    query_budget = 1
+
+    def post(self, request, *args, **kwargs):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return Response(
+                {"error": "Прием событий stripe не настроен."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        try:
+            event = parse_stripe_event(
+                request.body, request.META.get("HTTP_STRIPE_SIGNATURE", "")
+            )
+        except (ValueError, stripe.SignatureVerificationError):
+            return Response(
+                {"error": "Неверная подпись события."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        payment_status = payment_status_from_event(event)
+        updated = 0
+        if payment_status:
+            updated = apply_session_status(
+                event["data"]["object"]["id"], payment_status
+            )
+        return Response({"received": True, "updated": updated})